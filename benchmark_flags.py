@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Report the size of the simplified tables and the time
+# spent simplifying at each GC of a run of 20N generations.
+# Then compare using the node flags of the simplified tables
+# as the samples, as msprime does when loading tables,
+# when only the current generation is flagged and when
+# every node is flagged.  The latter is what we did before
+# flags were cleared after each GC.
+#
+# Usage: python benchmark_flags.py N rho gc_interval seed
+
+import sys
+import time
+import numpy as np
+import msprime
+import fwdpy11_arg_example.evolve_arg as ea
+
+N = int(sys.argv[1])
+rho = float(sys.argv[2])
+gc_interval = int(sys.argv[3])
+seed = int(sys.argv[4])
+simplifier, atracker, tsim = ea.evolve_track_wrapper(popsize=N, rho=rho,
+                                                     seed=seed,
+                                                     gc_interval=gc_interval,
+                                                     mu=0.0)
+
+records = simplifier.gc_records
+print("Simulated in {} seconds, with {} GCs".format(tsim, len(records)))
+print("generation\tnodes\tedges\tbytes\tseconds")
+for r in records:
+    print("{}\t{}\t{}\t{}\t{}".format(r['generation'], r['table_nodes'],
+                                      r['table_edges'], r['table_bytes'],
+                                      r['time_simplifying']))
+if len(records) > 0:
+    print("Largest simplified history: {} bytes".format(
+        max(r['table_bytes'] for r in records)))
+    print("Total time simplifying: {} seconds".format(
+        sum(r['time_simplifying'] for r in records)))
+
+nodes = simplifier.nodes
+edges = simplifier.edgesets
+flags = nodes.flags
+print("{} nodes and {} edges, {} of the nodes flagged as samples".format(
+    nodes.num_rows, edges.num_rows, np.count_nonzero(flags)))
+
+for label, samples in (("flagged nodes", np.where(flags == 1)[0]),
+                       ("all nodes", np.arange(nodes.num_rows))):
+    n = msprime.NodeTable()
+    e = msprime.EdgesetTable()
+    n.set_columns(flags=flags, population=nodes.population, time=nodes.time)
+    e.set_columns(left=edges.left, right=edges.right, parent=edges.parent,
+                  children=edges.children,
+                  children_length=edges.children_length)
+    start = time.time()
+    msprime.simplify_tables(samples=samples.astype(np.int32), nodes=n,
+                            edgesets=e)
+    stop = time.time()
+    print("Simplifying with the {} as samples: {} seconds, "
+          "{} nodes and {} edges kept".format(label, stop - start,
+                                              n.num_rows, e.num_rows))
@@ -1,7 +1,7 @@
 import argparse
 import sys
 import numpy as np
-from fwdpy11_arg_example.evolve_arg import evolve_track
+from fwdpy11_arg_example.evolve_arg import evolve_track, autotune_gc_interval
 import fwdpy11 as fp11
 import fwdpy11.fitness
 import fwdpy11.model_params
@@ -29,6 +29,10 @@ def parse_args():
     parser.add_argument('--seed', '-S', type=int,  help="RNG seed")
     parser.add_argument('--gc', '-G', type=int,
                         help="GC interval")
+    parser.add_argument('--autotune', action='store_true',
+                        help="Choose the GC interval with pilot simulations, ignoring --gc")
+    parser.add_argument('--max_bytes', type=int, default=None,
+                        help="With --autotune, the most memory the ARG tracking may use")
     parser.add_argument('--neutral', action='store_true',
                         help="Simulate no selection")
     parser.add_argument('--neutral_mutations',
@@ -82,6 +86,11 @@ if __name__ == "__main__":
         s = fwdpy11.sampling.sample_separate(rng, pop, args.nsam)
     else:
         # Use this module
+        if args.autotune is True:
+            args.gc = autotune_gc_interval(params, args.popsize,
+                                           max_bytes=args.max_bytes,
+                                           seed=args.seed)
+            print('Autotuned GC interval is {}'.format(args.gc))
         simplifier, atracker, tsim = evolve_track(
             rng, pop, params, args.gc)
         # Take times from simplifier before they change.
@@ -19,13 +19,23 @@
 #include <vector>
 #include <map>
 #include <limits>
+#include <cmath>
+#include <chrono>
 #include <cstdint>
+#include <type_traits>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 #include <pybind11/numpy.h>
 
 #include "node.hpp"
 #include "edge.hpp"
+#include "meiosis.hpp"
+#include "shard.hpp"
+#include "parallel_sort.hpp"
+#include "simplify.hpp"
+#include "columns.hpp"
+#include "compact.hpp"
+#include "generation_stats.hpp"
 
 struct ancestry_tracker
 {
@@ -34,23 +44,146 @@ struct ancestry_tracker
     std::vector<node> nodes;
     /// The ARG:
     std::vector<edge> edges;
-    /// The edges generated for each generation:
-    std::vector<edge> temp;
     /// This is used as the sample indexes for msprime:
     std::vector<integer_type> offspring_indexes;
+    /// Columnar staging copies of nodes and edges,
+    /// filled by prep_for_gc from nodes and edges:
+    node_columns node_table;
+    edge_columns edge_table;
+    /// Where each generation's nodes and edges start
+    /// in nodes and edges.  The i-th entries are for
+    /// generation generation - edge_offsets.size() + i:
+    std::vector<std::size_t> node_offsets, edge_offsets;
+    /// Scratch space for the breakpoints of one meiosis:
+    std::vector<double> breakpoints;
+    /// Number of times that one of the tracker's buffers
+    /// above had to grow while a generation was made.
+    /// Once the buffers are big enough, this stops
+    /// increasing.  Only these buffers are counted: fwdpp's
+    /// gametes and mutations, the shards, and starting
+    /// threads may still allocate memory.
+    std::size_t buffer_reallocations;
+    /// Capacities of nodes, edges, offspring_indexes,
+    /// breakpoints, meioses, and breakpoint_pool at
+    /// the end of the last generation:
+    std::size_t buffer_capacities[6];
+    /// Edges of the generation being produced are
+    /// written straight to edges, starting here:
+    std::size_t first_offspring_edge;
+    /// After simplify is called, the first
+    /// simplified_edges edges are its output:
+    std::size_t simplified_edges;
     integer_type generation, next_index, first_parental_index;
     std::uint32_t lastN;
     decltype(node::generation) last_gc_time;
-    ancestry_tracker(const integer_type N)
+    /// If true, each generation's edges are sorted
+    /// as they are added, and sort_edges is linear time.
+    const bool presort_edges;
+    /// True if edges have been sorted since the
+    /// last generation was added.
+    bool edges_sorted;
+    /// True once simplify has been called. From then on,
+    /// nodes and edges also contain the simplified history.
+    bool native_simplification;
+    /// True if node IDs are handed to msprime, and so
+    /// must fit in 32 bits, even if integer_type is wider.
+    /// This is the case unless simplify is used.
+    bool msprime_ids;
+    /// If true, finish_generation removes parental
+    /// nodes that left no offspring, along with their edges.
+    bool prune_extinct;
+    /// Totals removed by pruning:
+    std::size_t pruned_nodes, pruned_edges;
+    /// Scratch space for prune_parental_generation:
+    std::vector<integer_type> prune_remap;
+    /// If true, meioses are recorded in meioses and
+    /// breakpoint_pool, and are only turned into edges
+    /// by make_deferred_edges.  This makes pruning unnecessary,
+    /// so prune_extinct has no effect.
+    const bool defer_edges;
+    std::vector<meiosis> meioses;
+    std::vector<double> breakpoint_pool;
+    /// Where each generation's meioses start in meioses:
+    std::vector<std::size_t> meiosis_offsets;
+    /// Meioses of the generation being
+    /// produced start here in meioses:
+    std::size_t first_offspring_meiosis;
+    /// Number of edges that were never made, because
+    /// their child left no descendants:
+    std::size_t skipped_edges;
+    /// Number of edges saved by add_edges, by extending
+    /// the previous edge of the same parent and child.
+    /// This stays 0 unless compact is true:
+    std::size_t coalesced_edges;
+    /// Totals of nodes and edges recorded, which are
+    /// used to estimate the number of edges per node.
+    /// Meioses count as the most edges that they can make:
+    std::size_t recorded_nodes, recorded_edges;
+    /// If nonzero, plan_capacity frees the memory of a
+    /// buffer whose capacity is more than shrink_factor
+    /// times what is planned for it:
+    double shrink_factor;
+    /// A ring buffer of counters for the last stats.size()
+    /// generations, which is empty unless enable_stats is
+    /// called.  Entry i is for the stats_recorded-th
+    /// generation if i is stats_recorded % stats.size().
+    std::vector<generation_stats> stats;
+    std::size_t stats_recorded;
+    /// Counters for the generation being produced:
+    generation_stats current_stats;
+    /// One shard per block of offspring, when
+    /// generations are made in parallel:
+    std::vector<ancestry_shard> shards;
+    /// Used by simplify, and kept between
+    /// calls so that it only allocates once:
+    ancestry_simplifier<integer_type> simplifier;
+    /// If true, nodes and edges are stored in compact_nodes
+    /// and compact_edges (see compact.hpp), and nodes and
+    /// edges stay empty.  This cannot be used with simplify.
+    const bool compact;
+    std::vector<compact_node> compact_nodes;
+    std::vector<compact_edge> compact_edges;
+    /// The ID of compact_nodes.front(), or of the
+    /// next node to be added if there are none:
+    integer_type first_compact_id;
+    ancestry_tracker(const integer_type N, const bool presort = false,
+                     const bool defer = false, const bool compact_ = false)
         : nodes{ std::vector<node>() }, edges{ std::vector<edge>() },
-          temp{ std::vector<edge>() },
-          offspring_indexes{ std::vector<integer_type>() }, generation{ 1 },
-          next_index{ 2 * N }, first_parental_index{ 0 },
-          lastN{ static_cast<std::uint32_t>(N) }, last_gc_time{ 0.0 }
+          offspring_indexes{ std::vector<integer_type>() }, node_table{},
+          edge_table{},
+          node_offsets{ std::vector<std::size_t>() },
+          edge_offsets{ std::vector<std::size_t>() },
+          breakpoints{ std::vector<double>() }, buffer_reallocations{ 0 },
+          buffer_capacities{ 0, 0, 0, 0, 0, 0 }, first_offspring_edge{ 0 },
+          simplified_edges{ 0 },
+          generation{ 1 }, next_index{ 2 * N }, first_parental_index{ 0 },
+          lastN{ static_cast<std::uint32_t>(N) }, last_gc_time{ 0.0 },
+          presort_edges{ presort }, edges_sorted{ false },
+          native_simplification{ false }, msprime_ids{ true },
+          prune_extinct{ false },
+          pruned_nodes{ 0 }, pruned_edges{ 0 },
+          prune_remap{ std::vector<integer_type>() }, defer_edges{ defer },
+          meioses{ std::vector<meiosis>() },
+          breakpoint_pool{ std::vector<double>() },
+          meiosis_offsets{ std::vector<std::size_t>() },
+          first_offspring_meiosis{ 0 }, skipped_edges{ 0 },
+          coalesced_edges{ 0 }, recorded_nodes{ 0 }, recorded_edges{ 0 },
+          shrink_factor{ 0. }, stats{ std::vector<generation_stats>() },
+          stats_recorded{ 0 }, current_stats(make_generation_stats()),
+          shards{ std::vector<ancestry_shard>() }, compact{ compact_ },
+          compact_nodes{ std::vector<compact_node>() },
+          compact_edges{ std::vector<compact_edge>() }, first_compact_id{ 0 }
     {
+        if (compact)
+            {
+                compact_nodes.reserve(2 * N);
+                compact_edges.reserve(2 * N);
+                //IDs are implicit
+                compact_nodes.assign(2 * N, make_compact_node(0, 0));
+                return;
+            }
         nodes.reserve(2 * N);
         edges.reserve(2 * N);
-        temp.reserve(N);
 
         //Initialize 2N nodes for the generation 0
         for (integer_type i = 0; i < 2 * N; ++i)
@@ -61,7 +194,7 @@ struct ancestry_tracker
     }
 
     std::tuple<integer_type, integer_type>
-    get_parent_ids(const std::uint32_t p, const int did_swap)
+    get_parent_ids(const std::uint32_t p, const int did_swap) const
     {
         return std::make_tuple(
             first_parental_index + 2 * static_cast<integer_type>(p) + did_swap,
@@ -79,45 +212,916 @@ struct ancestry_tracker
         return rv;
     }
 
+    bool
+    next_generation_overflows(const std::uint32_t N_next) const
+    /// Returns true if adding N_next diploids would give
+    /// node IDs that do not fit in integer_type, or in
+    /// msprime's 32-bit IDs if msprime_ids is true.
+    {
+        const std::int64_t max_id
+            = msprime_ids ? std::numeric_limits<std::int32_t>::max()
+                          : std::numeric_limits<integer_type>::max();
+        if (static_cast<std::int64_t>(next_index) > max_id)
+            return true;
+        return 2 * static_cast<std::uint64_t>(N_next)
+               > static_cast<std::uint64_t>(
+                     max_id - static_cast<std::int64_t>(next_index));
+    }
+
     void
     add_edges(const std::vector<std::pair<double, double>>& breakpoints,
               const integer_type parent, const integer_type child)
     {
         for (auto&& bi : breakpoints)
             {
-                temp.emplace_back(
-                    make_edge(bi.first, bi.second, parent, child));
+                coalesced_edges += append_edge(edges, bi.first, bi.second,
+                                               parent, child);
+            }
+    }
+
+    template <typename edge_vector>
+    static std::size_t
+    add_edges(edge_vector& output, const double* breakpoints,
+              const std::size_t nbreakpoints, const integer_type parent1,
+              const integer_type parent2, const integer_type child)
+    /// Add the edges from one meiosis to output.  The breakpoints must
+    /// be sorted and contain no duplicates.  The segments
+    /// between them alternate between the parental chromosomes,
+    /// starting with parent1.  All edges from parent1 come first.
+    /// Segments of the same parent that abut, because the one
+    /// between them is empty, give one edge.  Returns the
+    /// number of edges saved this way, which can only be
+    /// nonzero for compact edges, where rounding can make
+    /// two breakpoints equal.
+    {
+        std::size_t coalesced = 0;
+        for (std::size_t start = 0; start < 2; ++start)
+            {
+                const auto parent = start ? parent2 : parent1;
+                for (auto j = start; j <= nbreakpoints; j += 2)
+                    {
+                        const double left = j ? breakpoints[j - 1] : 0.;
+                        const double right
+                            = (j < nbreakpoints) ? breakpoints[j] : 1.;
+                        coalesced += append_edge(output, left, right,
+                                                 parent, child);
+                    }
+            }
+        return coalesced;
+    }
+
+    void
+    add_edges(const std::vector<double>& breakpoints,
+              const std::tuple<integer_type, integer_type>& pid,
+              const integer_type child)
+    /// Add the edges from one meiosis.  breakpoints are
+    /// as made by fwdpp: either empty, or sorted and ending
+    /// with a sentinel value.  They must contain no duplicates.
+    {
+        coalesced_edges += add_edges(
+            edges, breakpoints.data(),
+            breakpoints.empty() ? 0 : breakpoints.size() - 1,
+            std::get<0>(pid), std::get<1>(pid), child);
+    }
+
+    static std::size_t
+    remove_double_crossovers(std::vector<double>& breakpoints)
+    /// Remove repeated breakpoints, which fwdpp handles
+    /// internally, but which make msprime throw an error.
+    /// Returns the number removed.
+    {
+        const auto n = breakpoints.size();
+        breakpoints.erase(std::unique(breakpoints.begin(), breakpoints.end()),
+                          breakpoints.end());
+        return n - breakpoints.size();
+    }
+
+    void
+    enable_stats(const std::size_t generations)
+    /// Record counters for each generation, keeping
+    /// those of the last generations.  If generations
+    /// is 0, nothing is recorded.
+    {
+        stats.assign(generations, make_generation_stats());
+        stats_recorded = 0;
+        current_stats = make_generation_stats();
+    }
+
+    static void
+    count_breakpoints(generation_stats& s,
+                      const std::vector<double>& breakpoints,
+                      const std::size_t double_crossovers)
+    {
+        s.breakpoints += (breakpoints.empty() ? 0 : breakpoints.size() - 1)
+                         + double_crossovers;
+        s.double_crossovers += double_crossovers;
+    }
+
+    void
+    record_meiosis(const std::vector<double>& breakpoints,
+                   const std::tuple<integer_type, integer_type>& pid,
+                   const integer_type child,
+                   const std::size_t double_crossovers = 0)
+    /// Add the edges from one meiosis, or record the
+    /// meiosis if defer_edges is true.  See add_edges.
+    /// double_crossovers is the number of breakpoints
+    /// that remove_double_crossovers removed.
+    {
+        if (!stats.empty())
+            {
+                count_breakpoints(current_stats, breakpoints,
+                                  double_crossovers);
+            }
+        coalesced_edges += record_meiosis(breakpoints, pid, child, edges,
+                                          compact_edges, meioses,
+                                          breakpoint_pool);
+    }
+
+    void
+    record_meiosis(const std::vector<double>& breakpoints,
+                   const std::tuple<integer_type, integer_type>& pid,
+                   const integer_type child, ancestry_shard& shard,
+                   const std::size_t double_crossovers = 0) const
+    /// As above, but the edges or meiosis go to shard,
+    /// which finish_generation merges into the tracker.
+    {
+        if (!stats.empty())
+            {
+                count_breakpoints(shard.stats, breakpoints,
+                                  double_crossovers);
+            }
+        shard.coalesced_edges += record_meiosis(
+            breakpoints, pid, child, shard.edges, shard.compact_edges,
+            shard.meioses, shard.breakpoint_pool);
+    }
+
+    std::size_t
+    record_meiosis(const std::vector<double>& breakpoints,
+                   const std::tuple<integer_type, integer_type>& pid,
+                   const integer_type child, std::vector<edge>& edge_output,
+                   std::vector<compact_edge>& compact_edge_output,
+                   std::vector<meiosis>& meiosis_output,
+                   std::vector<double>& breakpoint_output) const
+    /// Returns the number of edges saved by add_edges.
+    {
+        const std::size_t nbreakpoints
+            = breakpoints.empty() ? 0 : breakpoints.size() - 1;
+        if (!defer_edges && compact)
+            {
+                return add_edges(compact_edge_output, breakpoints.data(),
+                                 nbreakpoints, std::get<0>(pid),
+                                 std::get<1>(pid), child);
+            }
+        if (!defer_edges)
+            {
+                return add_edges(edge_output, breakpoints.data(),
+                                 nbreakpoints, std::get<0>(pid),
+                                 std::get<1>(pid), child);
+            }
+        breakpoint_output.insert(breakpoint_output.end(), breakpoints.begin(),
+                                 breakpoints.begin() + nbreakpoints);
+        meiosis_output.emplace_back(make_meiosis(
+            std::get<0>(pid), std::get<1>(pid), child, nbreakpoints));
+        return 0;
+    }
+
+    void
+    merge_shards()
+    /// Add the contents of each shard, in order, and clear them.
+    {
+        for (auto& shard : shards)
+            {
+                edges.insert(edges.end(), shard.edges.begin(),
+                             shard.edges.end());
+                compact_edges.insert(compact_edges.end(),
+                                     shard.compact_edges.begin(),
+                                     shard.compact_edges.end());
+                meioses.insert(meioses.end(), shard.meioses.begin(),
+                               shard.meioses.end());
+                breakpoint_pool.insert(breakpoint_pool.end(),
+                                       shard.breakpoint_pool.begin(),
+                                       shard.breakpoint_pool.end());
+                coalesced_edges += shard.coalesced_edges;
+                current_stats.breakpoints += shard.stats.breakpoints;
+                current_stats.double_crossovers
+                    += shard.stats.double_crossovers;
+                shard.clear();
+            }
+    }
+
+    std::size_t
+    pending_edges() const
+    /// The number of edges not yet simplified.  For
+    /// meioses that are not yet turned into edges, this
+    /// is the most edges that they can make.
+    {
+        return edges.size() - simplified_edges + compact_edges.size()
+               + meioses.size() + breakpoint_pool.size();
+    }
+
+    std::size_t
+    num_nodes() const
+    {
+        return compact ? compact_nodes.size() : nodes.size();
+    }
+
+    std::size_t
+    memory_used() const
+    /// The number of bytes reserved by the buffers of nodes,
+    /// edges, meioses and columns.  Scratch space that does not
+    /// grow with the number of nodes is not counted.
+    {
+        const auto bytes = [](const auto& v) {
+            return v.capacity() * sizeof(typename std::decay<decltype(
+                                             v)>::type::value_type);
+        };
+        return bytes(nodes) + bytes(edges) + bytes(compact_nodes)
+               + bytes(compact_edges) + bytes(meioses)
+               + bytes(breakpoint_pool) + bytes(meiosis_offsets)
+               + bytes(node_table.time) + bytes(node_table.population)
+               + bytes(node_table.flags) + bytes(edge_table.left)
+               + bytes(edge_table.right) + bytes(edge_table.parent)
+               + bytes(edge_table.child) + bytes(edge_table.children_length);
+    }
+
+    void
+    make_deferred_edges()
+    /// Turn the recorded meioses into edges, one generation
+    /// at a time.  Children that are not ancestral to the
+    /// current generation get no edges.
+    {
+        if (compact)
+            {
+                make_deferred_edges(compact_edges);
+            }
+        else
+            {
+                make_deferred_edges(edges);
             }
     }
 
+    template <typename edge_vector>
+    void
+    make_deferred_edges(edge_vector& output)
+    {
+        if (meioses.empty())
+            return;
+        // Going back in time, the parents of a child that
+        // is ancestral to the current generation are also
+        // ancestral.  Parents from before the oldest children
+        // are the samples from the last GC.
+        const auto first_id = meioses.front().child;
+        std::vector<char> ancestral(next_index - first_id, 0);
+        auto mark = [&ancestral, first_id](const integer_type id) {
+            if (id >= first_id)
+                {
+                    ancestral[id - first_id] = 1;
+                }
+        };
+        for (auto&& o : offspring_indexes)
+            {
+                mark(o);
+            }
+        for (auto m = meioses.rbegin(); m != meioses.rend(); ++m)
+            {
+                if (ancestral[m->child - first_id])
+                    {
+                        mark(m->parent1);
+                        if (m->nbreakpoints)
+                            {
+                                mark(m->parent2);
+                            }
+                    }
+            }
+
+        const double* bp = breakpoint_pool.data();
+        for (std::size_t g = 0; g < meiosis_offsets.size(); ++g)
+            {
+                const auto end = (g + 1 < meiosis_offsets.size())
+                                     ? meiosis_offsets[g + 1]
+                                     : meioses.size();
+                const auto first_edge = output.size();
+                edge_offsets.push_back(first_edge);
+                for (auto i = meiosis_offsets[g]; i < end; ++i)
+                    {
+                        const auto& m = meioses[i];
+                        if (ancestral[m.child - first_id])
+                            {
+                                coalesced_edges
+                                    += add_edges(output, bp, m.nbreakpoints,
+                                                 m.parent1, m.parent2,
+                                                 m.child);
+                            }
+                        else
+                            {
+                                skipped_edges += m.nbreakpoints + 1;
+                            }
+                        bp += m.nbreakpoints;
+                    }
+                if (presort_edges)
+                    {
+                        sort_generation(output, first_edge);
+                    }
+            }
+        meioses.clear();
+        breakpoint_pool.clear();
+        meiosis_offsets.clear();
+        first_offspring_meiosis = 0;
+        first_offspring_edge = output.size();
+    }
+
+    template <typename edge_vector>
+    static void
+    sort_generation(edge_vector& buffer, const std::size_t first)
+    /// Sort the edges of one generation, from first
+    /// to the end of buffer.
+    {
+        using edge_type = typename edge_vector::value_type;
+        // All parents are from the same generation,
+        // so their times are all the same.
+        const double parent_time = 0.0;
+        std::sort(buffer.begin() + first, buffer.end(),
+                  [&parent_time](const edge_type& a, const edge_type& b) {
+                      return get_tied_edge_msprime(a, parent_time)
+                             < get_tied_edge_msprime(b, parent_time);
+                  });
+    }
+
+    void
+    count_buffer_reallocations(const bool count = true)
+    /// If count is false, the capacities are
+    /// recorded without counting reallocations.
+    {
+        const std::size_t capacities[6]
+            = { compact ? compact_nodes.capacity() : nodes.capacity(),
+                compact ? compact_edges.capacity() : edges.capacity(),
+                offspring_indexes.capacity(),
+                breakpoints.capacity(),
+                meioses.capacity(),
+                breakpoint_pool.capacity() };
+        for (std::size_t i = 0; i < 6; ++i)
+            {
+                if (count && capacities[i] > buffer_capacities[i])
+                    {
+                        ++buffer_reallocations;
+                    }
+                buffer_capacities[i] = capacities[i];
+            }
+    }
+
+    template <typename T>
+    void
+    plan_buffer(std::vector<T>& buffer, const std::size_t capacity) const
+    /// Reserve capacity, or release memory as
+    /// set by shrink_factor.  capacity must be
+    /// at least buffer.size().
+    {
+        if (buffer.capacity() < capacity)
+            {
+                buffer.reserve(capacity);
+            }
+        else
+            {
+                shrink_buffer(buffer, capacity);
+            }
+    }
+
+    template <typename T>
+    void
+    shrink_buffer(std::vector<T>& buffer, const std::size_t capacity) const
+    /// Release memory as set by shrink_factor, without
+    /// reserving any.  capacity must be at least buffer.size().
+    {
+        if (shrink_factor > 0.
+            && buffer.capacity() > shrink_factor * capacity)
+            {
+                std::vector<T> smaller;
+                smaller.reserve(capacity);
+                smaller.assign(buffer.begin(), buffer.end());
+                buffer.swap(smaller);
+            }
+    }
+
+    template <typename iterator>
+    void
+    plan_capacity(iterator first, iterator last,
+                  const double default_edges_per_node)
+    /// Reserve the buffers for generations with the
+    /// population sizes in [first, last).  The number of
+    /// edges per node is estimated from what has been
+    /// recorded, or is default_edges_per_node at first,
+    /// plus ten percent.  This is called at the start of a simulation and
+    /// after each GC, so that making offspring does not
+    /// reallocate until the next GC.
+    {
+        std::size_t new_nodes = 0, max_nodes = 0, ngenerations = 0;
+        for (; first != last; ++first, ++ngenerations)
+            {
+                const std::size_t n = 2 * static_cast<std::size_t>(*first);
+                new_nodes += n;
+                max_nodes = std::max(max_nodes, n);
+            }
+        const double edges_per_node
+            = recorded_nodes ? static_cast<double>(recorded_edges)
+                                   / static_cast<double>(recorded_nodes)
+                             : default_edges_per_node;
+        // The number of edges is random, so we
+        // leave some room above the estimate.
+        const auto new_edges = static_cast<std::size_t>(std::ceil(
+            1.1 * edges_per_node * static_cast<double>(new_nodes)));
+        if (compact)
+            {
+                plan_buffer(compact_nodes, compact_nodes.size() + new_nodes);
+            }
+        else
+            {
+                plan_buffer(nodes, nodes.size() + new_nodes);
+            }
+        if (defer_edges)
+            {
+                // Two meioses per diploid, and one breakpoint
+                // for each edge after the first of a meiosis.
+                plan_buffer(meioses, meioses.size() + new_nodes);
+                plan_buffer(breakpoint_pool,
+                            breakpoint_pool.size()
+                                + (new_edges > new_nodes
+                                       ? new_edges - new_nodes
+                                       : 0));
+            }
+        else if (compact)
+            {
+                plan_buffer(compact_edges, compact_edges.size() + new_edges);
+            }
+        else
+            {
+                plan_buffer(edges, edges.size() + new_edges);
+            }
+        plan_buffer(offspring_indexes, max_nodes);
+        plan_buffer(node_offsets, node_offsets.size() + ngenerations);
+        plan_buffer(edge_offsets, edge_offsets.size() + ngenerations);
+        plan_buffer(meiosis_offsets, meiosis_offsets.size() + ngenerations);
+        // The columns are only filled when simplifying, so they
+        // are not reserved, but they keep their peak capacity
+        // after a GC unless it is released here.
+        const auto node_rows = num_nodes() + new_nodes;
+        const auto edge_rows
+            = (compact ? compact_edges.size() : edges.size()) + new_edges;
+        shrink_buffer(node_table.time, node_rows);
+        shrink_buffer(node_table.population, node_rows);
+        shrink_buffer(node_table.flags, node_rows);
+        shrink_buffer(edge_table.left, edge_rows);
+        shrink_buffer(edge_table.right, edge_rows);
+        shrink_buffer(edge_table.parent, edge_rows);
+        shrink_buffer(edge_table.child, edge_rows);
+        shrink_buffer(edge_table.children_length, edge_rows);
+        count_buffer_reallocations(false);
+    }
+
+    void
+    prune_parental_generation()
+    /// Remove nodes from the parental generation
+    /// that are not parents of any offspring edge.
+    /// The parental generation must be the last
+    /// nodes and the children of the last edges
+    /// before first_offspring_edge.  Only that
+    /// generation is pruned, so their parents are
+    /// kept even if they no longer have children.
+    {
+        if (compact)
+            {
+                prune_parental_generation(compact_nodes, compact_edges);
+            }
+        else
+            {
+                prune_parental_generation(nodes, edges);
+            }
+    }
+
+    static void
+    set_node_id(node& n, const integer_type id)
+    {
+        n.id = id;
+    }
+
+    static void
+    set_node_id(compact_node&, const integer_type)
+    /// IDs of compact nodes are implicit.
+    {
+    }
+
+    template <typename node_vector, typename edge_vector>
+    void
+    prune_parental_generation(node_vector& nodes, edge_vector& edges)
+    {
+        const auto nparents = offspring_indexes.front() - first_parental_index;
+        const auto offspring_edges = edges.begin() + first_offspring_edge;
+        auto& remap = prune_remap;
+        remap.assign(nparents, -1);
+        for (auto i = offspring_edges; i < edges.end(); ++i)
+            {
+                remap[i->parent - first_parental_index] = 0;
+            }
+        // Survivors are renumbered in order, so that
+        // IDs stay contiguous and sort orders are kept.
+        integer_type next_id = first_parental_index;
+        for (auto& r : remap)
+            {
+                if (r == 0)
+                    {
+                        r = next_id++;
+                    }
+            }
+        const integer_type nremoved
+            = nparents - (next_id - first_parental_index);
+        if (nremoved == 0)
+            return;
+
+        // The parental nodes are in ID order.
+        auto n = nodes.begin() + (nodes.size() - nparents);
+        for (auto i = n; i < nodes.end(); ++i)
+            {
+                const auto id = remap[i - (nodes.end() - nparents)];
+                if (id != -1)
+                    {
+                        set_node_id(*i, id);
+                        *n++ = *i;
+                    }
+            }
+        nodes.erase(n, nodes.end());
+
+        // The offspring edges are moved down to
+        // follow the parental edges that are kept.
+        auto e = edges.begin() + edge_offsets.back();
+        const auto nedges = edges.size();
+        for (auto i = e; i < offspring_edges; ++i)
+            {
+                const auto id = remap[i->child - first_parental_index];
+                if (id != -1)
+                    {
+                        i->child = id;
+                        *e++ = *i;
+                    }
+            }
+        first_offspring_edge = e - edges.begin();
+        for (auto i = offspring_edges; i < edges.end(); ++i)
+            {
+                i->parent = remap[i->parent - first_parental_index];
+                i->child -= nremoved;
+                *e++ = *i;
+            }
+        edges.erase(e, edges.end());
+
+        for (auto& oi : offspring_indexes)
+            {
+                oi -= nremoved;
+            }
+        next_index -= nremoved;
+        pruned_nodes += nremoved;
+        pruned_edges += nedges - edges.size();
+    }
+
     void
     finish_generation()
     {
+        const auto start = stats.empty()
+                               ? std::chrono::steady_clock::time_point()
+                               : std::chrono::steady_clock::now();
+        merge_shards();
+        std::size_t new_edges = 0;
+        if (defer_edges)
+            {
+                for (auto i = first_offspring_meiosis; i < meioses.size();
+                     ++i)
+                    {
+                        new_edges += meioses[i].nbreakpoints + 1;
+                    }
+            }
+        else
+            {
+                new_edges = (compact ? compact_edges.size() : edges.size())
+                            - first_offspring_edge;
+            }
+        recorded_nodes += offspring_indexes.size();
+        recorded_edges += new_edges;
+        // The parental generation can only be pruned if
+        // its edges are in the current buffer, which is not
+        // the case for the first generation after a GC.
+        if (prune_extinct && !defer_edges && !edge_offsets.empty()
+            && !offspring_indexes.empty())
+            {
+                prune_parental_generation();
+            }
+        node_offsets.push_back(num_nodes());
         for (auto&& oi : offspring_indexes)
             {
-                nodes.emplace_back(make_node(oi, generation, 0));
+                if (compact)
+                    {
+                        compact_nodes.emplace_back(
+                            make_compact_node(generation, 0));
+                    }
+                else
+                    {
+                        nodes.emplace_back(make_node(oi, generation, 0));
+                    }
+            }
+        if (defer_edges)
+            {
+                meiosis_offsets.push_back(first_offspring_meiosis);
+                first_offspring_meiosis = meioses.size();
+            }
+        else
+            {
+                if (presort_edges && compact)
+                    {
+                        sort_generation(compact_edges, first_offspring_edge);
+                    }
+                else if (presort_edges)
+                    {
+                        sort_generation(edges, first_offspring_edge);
+                    }
+                edge_offsets.push_back(first_offspring_edge);
+                first_offspring_edge
+                    = compact ? compact_edges.size() : edges.size();
             }
-        edges.insert(edges.end(), temp.begin(), temp.end());
         lastN = next_index - first_parental_index;
         first_parental_index = offspring_indexes.front();
 
-        temp.clear();
+        count_buffer_reallocations();
+        edges_sorted = false;
+        if (!stats.empty())
+            {
+                current_stats.generation = generation;
+                current_stats.nodes
+                    = static_cast<std::uint32_t>(offspring_indexes.size());
+                current_stats.edges = new_edges;
+                current_stats.buffer_reallocations = buffer_reallocations;
+                current_stats.finish_seconds
+                    = std::chrono::duration<double>(
+                          std::chrono::steady_clock::now() - start)
+                          .count();
+                stats[stats_recorded++ % stats.size()] = current_stats;
+                current_stats = make_generation_stats();
+            }
         ++generation;
     }
 
     void
-    prep_for_gc()
+    sort_edges(const unsigned nthreads = 0)
     {
-        if (nodes.empty())
+        // Sort the edges into the order required by msprime.
+        // Node times are still forwards in time here, so
+        // this must be called before prep_for_gc.
+        // Edges that are output from simplify are already
+        // sorted and are not touched.
+        make_deferred_edges();
+        if (compact)
+            {
+                sort_edges(compact_edges, nthreads);
+            }
+        else
+            {
+                sort_edges(edges, nthreads);
+            }
+    }
+
+    template <typename edge_vector>
+    void
+    sort_edges(edge_vector& edges, const unsigned nthreads)
+    {
+        using edge_type = typename edge_vector::value_type;
+        if (edges_sorted || edges.size() == simplified_edges)
             return;
+        edges_sorted = true;
+        const auto first = edges.begin() + simplified_edges;
+
+        if (presort_edges)
+            {
+                // Each generation is already sorted, and a
+                // generation's parents are younger than those
+                // of the generation before it.  Reversing the
+                // order of the generations is all that is left
+                // to do, which we do by reversing everything and
+                // then putting each generation back in order.
+                const auto n = edges.size();
+                std::reverse(first, edges.end());
+                for (std::size_t i = 0; i < edge_offsets.size(); ++i)
+                    {
+                        const auto block_end = (i + 1 < edge_offsets.size())
+                                                   ? edge_offsets[i + 1]
+                                                   : n;
+                        std::reverse(
+                            first + (n - block_end),
+                            first + (n - edge_offsets[i]));
+                    }
+                return;
+            }
+
+        // Parents that are not in nodes are the samples
+        // from the last GC.  They are older than any node
+        // that we have, and are therefore sorted last.
+        integer_type first_id = first_compact_id;
+        if (!compact)
+            {
+                first_id = nodes.empty()
+                               ? next_index
+                               : static_cast<integer_type>(nodes.front().id);
+            }
+        std::vector<double> parent_time(next_index - first_id,
+                                        std::numeric_limits<double>::max());
+        for (std::size_t i = 0; i < compact_nodes.size(); ++i)
+            {
+                parent_time[i] = -compact_nodes[i].generation;
+            }
+        for (auto&& n : nodes)
+            {
+                parent_time[n.id - first_id] = -n.generation;
+            }
+        auto get_time = [&parent_time, first_id](const integer_type p) {
+            return (p < first_id) ? std::numeric_limits<double>::max()
+                                  : parent_time[p - first_id];
+        };
+        parallel_sort(first, edges.end(),
+                      [&get_time](const edge_type& a, const edge_type& b) {
+                          const double ta = get_time(a.parent),
+                                       tb = get_time(b.parent);
+                          return get_tied_edge_msprime(a, ta)
+                                 < get_tied_edge_msprime(b, tb);
+                      },
+                      nthreads);
+    }
+
+    const std::vector<integer_type>&
+    simplify(const std::vector<integer_type>& samples)
+    /// Simplify the nodes and edges in place, without
+    /// using msprime.  The current generation must be
+    /// the first nodes in samples, in order.
+    /// Returns the mapping from old to new node IDs,
+    /// which is valid until the next call.
+    {
+        if (compact)
+            {
+                throw std::runtime_error(
+                    "simplify cannot be used with compact storage");
+            }
+        if (!nodes.empty()
+            && (nodes.front().id != 0
+                || nodes.back().id != nodes.size() - 1))
+            {
+                throw std::runtime_error(
+                    "simplify requires that all nodes are stored in the "
+                    "tracker. Has msprime been used to simplify?");
+            }
+        sort_edges();
+        const auto& idmap
+            = simplifier(nodes, edges, simplified_edges, samples);
+        simplified_edges = edges.size();
+        first_offspring_edge = edges.size();
+        node_offsets.clear();
+        edge_offsets.clear();
+        for (auto& o : offspring_indexes)
+            {
+                o = idmap[o];
+            }
+        first_parental_index
+            = offspring_indexes.empty() ? 0 : offspring_indexes.front();
+        next_index = static_cast<integer_type>(nodes.size());
+        native_simplification = true;
+        msprime_ids = false;
+        return idmap;
+    }
 
-        //convert forward time to backwards time
-        auto max_gen = nodes.back().generation;
+    ancestry_tracker
+    detach_buffers()
+    /// Move the current nodes, edges, and samples into a
+    /// new ancestry_tracker, which can then be simplified
+    /// while this one keeps recording.  Node IDs keep
+    /// increasing from next_index until remap_ids is called.
+    {
+        if (native_simplification)
+            {
+                throw std::runtime_error("cannot detach the buffers of a "
+                                         "natively-simplified tracker");
+            }
+        ancestry_tracker rv(0, presort_edges, defer_edges, compact);
+        rv.nodes.swap(nodes);
+        rv.edges.swap(edges);
+        rv.compact_nodes.swap(compact_nodes);
+        rv.compact_edges.swap(compact_edges);
+        rv.first_compact_id = first_compact_id;
+        first_compact_id = next_index;
+        rv.node_offsets.swap(node_offsets);
+        rv.edge_offsets.swap(edge_offsets);
+        rv.first_offspring_edge = first_offspring_edge;
+        first_offspring_edge = 0;
+        rv.meioses.swap(meioses);
+        rv.breakpoint_pool.swap(breakpoint_pool);
+        rv.meiosis_offsets.swap(meiosis_offsets);
+        rv.first_offspring_meiosis = first_offspring_meiosis;
+        first_offspring_meiosis = 0;
+        rv.offspring_indexes = offspring_indexes;
+        rv.generation = generation;
+        rv.next_index = next_index;
+        rv.first_parental_index = first_parental_index;
+        rv.last_gc_time = last_gc_time;
+        rv.edges_sorted = edges_sorted;
+        edges_sorted = false;
+        return rv;
+    }
+
+    void
+    remap_ids(const integer_type first_sample,
+              const integer_type first_new_id,
+              const integer_type num_simplified_nodes)
+    /// Give the nodes recorded since detach_buffers
+    /// their final IDs, once the detached buffers have
+    /// been simplified.  IDs less than first_new_id
+    /// refer to the detached samples, which are now
+    /// the first nodes after simplification.  The rest
+    /// follow the num_simplified_nodes simplified nodes.
+    {
+        auto remap = [=](const integer_type id) {
+            return (id < first_new_id)
+                       ? id - first_sample
+                       : id - first_new_id + num_simplified_nodes;
+        };
         for (auto& n : nodes)
             {
-                n.generation -= max_gen;
-                n.generation *= -1.0;
+                n.id = remap(n.id);
+            }
+        for (auto& e : edges)
+            {
+                e.parent = remap(e.parent);
+                e.child = remap(e.child);
+            }
+        for (auto& e : compact_edges)
+            {
+                e.parent = remap(e.parent);
+                e.child = remap(e.child);
+            }
+        // The new nodes have contiguous IDs, so
+        // remapping keeps compact node IDs implicit.
+        first_compact_id = remap(first_compact_id);
+        for (auto& m : meioses)
+            {
+                m.parent1 = remap(m.parent1);
+                m.parent2 = remap(m.parent2);
+                m.child = remap(m.child);
+            }
+        for (auto& o : offspring_indexes)
+            {
+                o = remap(o);
+            }
+        first_parental_index = remap(first_parental_index);
+        next_index = remap(next_index);
+    }
+
+    void
+    prep_for_gc(const double epoch)
+    /// Fill node_table and edge_table.  Node times
+    /// are epoch minus the forward time of each node.
+    /// The nodes themselves are not changed.  Compact
+    /// nodes and edges are decoded here.  Only the
+    /// samples, offspring_indexes, are flagged.
+    {
+        // msprime's node IDs are 32-bit.  With 64-bit IDs,
+        // all IDs that we have must fit.
+        if (static_cast<std::int64_t>(next_index)
+            > std::numeric_limits<std::int32_t>::max())
+            {
+                throw std::runtime_error(
+                    "node IDs do not fit in msprime's 32-bit IDs. Simplify "
+                    "more often, or use native simplification");
+            }
+        if (compact)
+            {
+                node_table.fill(compact_nodes, epoch);
+                node_table.flag_samples(offspring_indexes, first_compact_id);
+                edge_table.fill(compact_edges);
+                return;
+            }
+        node_table.fill(nodes, epoch);
+        if (!nodes.empty())
+            {
+                node_table.flag_samples(
+                    offspring_indexes,
+                    static_cast<integer_type>(nodes.front().id));
+            }
+        edge_table.fill(edges);
+    }
+
+    void
+    prep_for_gc()
+    {
+        //convert forward time to backwards time,
+        //with the newest nodes at time 0.
+        if (compact)
+            {
+                prep_for_gc(compact_nodes.empty()
+                                ? 0.0
+                                : compact_nodes.back().generation);
+                return;
             }
+        prep_for_gc(nodes.empty() ? 0.0 : nodes.back().generation);
     }
 
     void
@@ -128,11 +1132,32 @@ struct ancestry_tracker
             return;
 
         last_gc_time = generation;
+        // None means that node IDs did not change,
+        // which is the case when the buffers were
+        // detached and are simplified in the background.
+        if (t[1].is_none())
+            return;
         next_index = t[1].cast<integer_type>();
         // establish last parental index:
         first_parental_index = 0;
+        // After a native simplification, the
+        // nodes and edges are the simplified history.
+        if (native_simplification)
+            return;
         nodes.clear();
         edges.clear();
+        compact_nodes.clear();
+        compact_edges.clear();
+        first_compact_id = next_index;
+        node_offsets.clear();
+        edge_offsets.clear();
+        first_offspring_edge = 0;
+        meioses.clear();
+        breakpoint_pool.clear();
+        meiosis_offsets.clear();
+        first_offspring_meiosis = 0;
+        node_table.clear();
+        edge_table.clear();
     }
 };
 
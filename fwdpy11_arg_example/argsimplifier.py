@@ -1,6 +1,170 @@
+import abc
+import math
 import numpy as np
 import msprime
+import threading
 import time
+import warnings
+
+
+class _Scratch(object):
+    """
+    NumPy arrays that are kept from one GC to the next.
+    Each one only grows, to the largest size needed so far,
+    so that a GC does not allocate once they are big enough.
+    """
+
+    def __init__(self):
+        self.__arrays = {}
+        self.bytes_allocated = 0
+
+    def get(self, name, n, dtype, fill=None):
+        """
+        Return the first n elements of the array called name.
+        If fill is not None, the array is filled with it when
+        it is allocated, and must not be written to.
+        """
+        a = self.__arrays.get(name)
+        if a is None or len(a) < n:
+            a = np.empty([max(n, 0 if a is None else 2 * len(a))],
+                         dtype=dtype)
+            if fill is not None:
+                a.fill(fill)
+            self.bytes_allocated += a.nbytes
+            self.__arrays[name] = a
+        return a[:n]
+
+
+class AdaptiveGC(metaclass=abc.ABCMeta):
+    """
+    Abstract base class for GC schedules that change a
+    GCPolicy after each GC, using what was measured during it.
+    Subclasses must define update.
+    """
+
+    def __init__(self, min_interval=1, max_interval=None):
+        """
+        :param min_interval: The smallest GC interval to set
+        :param max_interval: If not None, the largest GC interval to set
+        """
+        if min_interval < 1:
+            raise ValueError("min_interval must be > 0")
+        if max_interval is not None and max_interval < min_interval:
+            raise ValueError("max_interval must be at least min_interval")
+        self.min_interval = int(min_interval)
+        self.max_interval = max_interval
+
+    def start(self, gc_policy):
+        """
+        Called with the GCPolicy before a simulation starts.
+        """
+        pass
+
+    @abc.abstractmethod
+    def update(self, gc_policy, record):
+        """
+        Change gc_policy after a GC.
+
+        :param gc_policy: The GCPolicy used by the simulation
+        :param record: A dict describing the GC.  See ArgSimplifier.gc_records.
+        """
+        pass
+
+    def _interval(self, interval):
+        # Clamp to [min_interval, max_interval]
+        interval = max(self.min_interval, int(math.ceil(interval)))
+        if self.max_interval is not None:
+            interval = min(self.max_interval, interval)
+        return interval
+
+
+class EdgeBudget(AdaptiveGC):
+    """
+    Simplify when max_edges edges are waiting to be simplified.
+    The GC interval is set to the number of generations that
+    this takes at the rate seen since the last GC, so that the
+    tracker's buffers are reserved for about that many edges.
+    """
+
+    def __init__(self, max_edges, **kwargs):
+        super(EdgeBudget, self).__init__(**kwargs)
+        if max_edges < 1:
+            raise ValueError("max_edges must be > 0")
+        self.max_edges = int(max_edges)
+
+    def start(self, gc_policy):
+        gc_policy.max_edges = self.max_edges
+
+    def update(self, gc_policy, record):
+        per_generation = record['pending_edges'] / \
+            max(record['generations'], 1)
+        gc_policy.interval = self._interval(
+            self.max_edges / max(per_generation, 1.0))
+        gc_policy.max_edges = self.max_edges
+
+
+class MemoryBudget(AdaptiveGC):
+    """
+    Simplify so that the tracker's buffers plus msprime's
+    tables stay under max_bytes.  The number of bytes per
+    pending edge, which includes the nodes and columns, is
+    measured at each GC, and the rest of the budget is turned
+    into a number of edges.  If the simplified history alone
+    leaves no room, a RuntimeWarning is given and the schedule
+    is left as it is.  Memory that the tracker has
+    reserved is counted until it is released, so this works
+    best with a nonzero AncestryTracker.shrink_factor.
+    """
+
+    def __init__(self, max_bytes, **kwargs):
+        super(MemoryBudget, self).__init__(**kwargs)
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be > 0")
+        self.max_bytes = int(max_bytes)
+
+    def update(self, gc_policy, record):
+        pending = max(record['pending_edges'], 1)
+        bytes_per_edge = record['tracker_bytes'] / pending
+        per_generation = pending / max(record['generations'], 1)
+        available = self.max_bytes - record['table_bytes']
+        if available < bytes_per_edge:
+            # Simplifying every generation would not help
+            warnings.warn("the simplified history alone uses {} bytes, "
+                          "which leaves no room in the budget of {} bytes. "
+                          "The GC schedule is not changed.".format(
+                              record['table_bytes'], self.max_bytes),
+                          RuntimeWarning)
+            return
+        max_edges = int(available / bytes_per_edge)
+        gc_policy.max_edges = max_edges
+        gc_policy.interval = self._interval(max_edges / per_generation)
+
+
+class TimeRatio(AdaptiveGC):
+    """
+    Aim for a fixed ratio of the time spent simplifying
+    to the time spent simulating.  Each GC costs time in
+    proportion to the history that is kept, so simplifying
+    less often lowers the ratio.  The GC interval is scaled by
+    the measured ratio over the target, by at most a factor
+    of two each time.  Because the cost of the new edges does
+    not go away, a target that is too low makes the interval
+    grow until max_interval.  This cannot be used with background
+    simplification, where the time is not known until the next GC.
+    """
+
+    def __init__(self, target=0.1, **kwargs):
+        super(TimeRatio, self).__init__(**kwargs)
+        if target <= 0.0:
+            raise ValueError("target must be > 0")
+        self.target = float(target)
+
+    def update(self, gc_policy, record):
+        if record['time_simulating'] <= 0.0:
+            return
+        ratio = record['time_simplifying'] / record['time_simulating']
+        scale = min(max(ratio / self.target, 0.5), 2.0)
+        gc_policy.interval = self._interval(gc_policy.interval * scale)
 
 
 class ArgSimplifier(object):
@@ -9,11 +173,32 @@ class ArgSimplifier(object):
     AncestryTracker and msprime
     """
 
-    def __init__(self, gc_interval):
+    def __init__(self, gc_interval, native=False, background=False,
+                 adaptive_gc=None):
         """
         :param gc_interval: Garbage collection interval
+        :param native: If True, use AncestryTracker.simplify instead of msprime
+        :param background: If True, simplify with msprime in a separate thread while the simulation continues
+        :param adaptive_gc: If not None, an instance of AdaptiveGC, which changes gc_policy after each GC
         """
+        if adaptive_gc is not None and not isinstance(adaptive_gc,
+                                                      AdaptiveGC):
+            raise TypeError("adaptive_gc must be an instance of AdaptiveGC")
+        if native is True and background is True:
+            raise ValueError("native and background simplification "
+                             "cannot be combined")
+        if background is True and isinstance(adaptive_gc, TimeRatio):
+            # The worker's time is not known until the next GC
+            raise ValueError("TimeRatio cannot be used with background "
+                             "simplification")
         self.gc_interval = gc_interval
+        self.__native = bool(native)
+        self.__background = bool(background)
+        self.__worker = None
+        self.__worker_result = None
+        self.__detached_ids = None
+        self.__epoch = 0.0
+        self.__time_offset = 0.0
         self.last_gc_time = 0.0
         self.__nodes = msprime.NodeTable()
         self.__edges = msprime.EdgesetTable()
@@ -21,54 +206,306 @@ class ArgSimplifier(object):
         self.__time_appending = 0.0
         self.__time_simplifying = 0.0
         self.__time_prepping = 0.0
+        self.__scratch = _Scratch()
+        # After msprime simplifies, the samples are its
+        # first rows, and they are the only nodes that
+        # should be flagged as samples.
+        self.__num_samples = 0
+        self.__stale_flags = False
+        self.__bytes_allocated = []
+        self.__adaptive_gc = adaptive_gc
+        self.gc_policy = None
+        self.__gc_records = []
+        self.__last_simplify_end = time.time()
 
     def simplify(self, generation, ancestry):
-        # update node times:
-        if self.__nodes.num_rows > 0:
-            tc = self.__nodes.time
-            dt = float(generation) - self.last_gc_time
-            tc += dt
-            self.last_gc_time = generation
-            flags = np.empty([self.__nodes.num_rows], dtype=np.uint32)
-            flags.fill(1)
-            self.__nodes.set_columns(
-                flags=flags, population=self.__nodes.population, time=tc)
+        """
+        This is called from C++ during a simulation,
+        whenever it is time to simplify.
 
+        :param generation: Current generation in a simulation.
+        :param ancestry: An instance of AncestryTracker
+
+        :rtype: tuple
+
+        :returns: True and the number of nodes after simplification
+        """
         start = time.time()
-        ancestry.prep_for_gc()
-        na = np.array(ancestry.nodes, copy=False)
-        ea = np.array(ancestry.edges, copy=False)
-        samples = np.array(ancestry.samples, copy=False)
-        flags = np.empty([len(na)], dtype=np.uint32)
-        flags.fill(1)
+        if self.__background is True:
+            # The worker thread owns the tables and the epoch
+            # until it is joined, so we must not read them before.
+            self.__wait_for_worker(ancestry)
+        record = {'generation': generation,
+                  'generations': generation - self.last_gc_time,
+                  'pending_edges': ancestry.pending_edges(),
+                  'tracker_bytes': ancestry.memory_used(),
+                  'time_simulating': start - self.__last_simplify_end}
+        self.last_gc_time = generation
+        if self.__native is True:
+            rv = self.__simplify_native(generation, ancestry)
+        elif self.__background is True:
+            rv = self.__simplify_background(generation, ancestry, record)
+        else:
+            rv = self.__simplify_msprime(generation, ancestry)
+        self.__last_simplify_end = time.time()
+        if self.__background is True:
+            # The worker's own time is filled in when it is joined
+            record['time_waiting'] = self.__last_simplify_end - start
+        else:
+            record['time_simplifying'] = self.__last_simplify_end - start
+        # The size of the simplified history, which is kept by
+        # the tracker with native simplification.  A row of
+        # msprime's node table has flags, population and time,
+        # and a row of the edge table has one child.  In the
+        # background, this is the size after the previous GC.
+        if self.__native is True:
+            rows = (len(ancestry.nodes), len(ancestry.edges))
+        else:
+            rows = (self.__nodes.num_rows, self.__edges.num_rows)
+        record['table_nodes'], record['table_edges'] = rows
+        record['table_bytes'] = 16 * rows[0] + 28 * rows[1]
+        if self.gc_policy is not None:
+            if self.__adaptive_gc is not None:
+                self.__adaptive_gc.update(self.gc_policy, record)
+                self.gc_interval = self.gc_policy.interval
+            record['interval'] = self.gc_policy.interval
+            record['max_edges'] = self.gc_policy.max_edges
+        self.__gc_records.append(record)
+        return rv
+
+    def __simplify_msprime(self, generation, ancestry):
+        # Node times in our table are self.__epoch minus
+        # forward time, so the times of nodes already in
+        # the table stay valid as the simulation goes on.
+        if ancestry.num_nodes() > 0:
+            # The newest nodes are from the generation before
+            # the offspring generation.  Compact trackers do not
+            # fill ancestry.nodes, so we do not read it here.
+            newest = ancestry.offspring_generation - 1
+            if newest > self.__epoch:
+                self.__move_epoch(2.0 * newest)
+            # The samples are the newest nodes, and
+            # should be at time 0 in backwards time:
+            self.__time_offset = self.__epoch - newest
+
+        # The C++ side sorts the new edges, using forward time.
+        start = time.time()
+        ancestry.sort_edges()
+        stop = time.time()
+        self.__time_sorting += (stop - start)
+
+        start = time.time()
+        ancestry.prep_for_gc(self.__epoch)
+        # Columnar views of the nodes and edges, so that
+        # appending to the tables only copies contiguous memory.
+        # prep_for_gc has already copied the structs into them:
+        nt = ancestry.node_table
+        et = ancestry.edge_table
+        # msprime takes the samples as a buffer, which
+        # is only copied if node IDs are 64-bit:
+        sample_ids = np.array(ancestry.samples, copy=False)
+        samples = np.asarray(sample_ids, dtype=np.int32)
         stop = time.time()
         self.__time_prepping += (stop - start)
 
         start = time.time()
-        self.__nodes.append_columns(flags=flags,
-                                    population=na['population'],
-                                    time=na['generation'])
-        self.__edges.append_columns(left=ea['left'],
-                                    right=ea['right'],
-                                    parent=ea['parent'],
-                                    children=ea['child'],
-                                    children_length=[1] * len(ea))
+        scratch_bytes = self.__scratch.bytes_allocated
+        copied_bytes = 0 if samples is sample_ids else samples.nbytes
+        self.__nodes.append_columns(flags=nt.flags,
+                                    population=nt.population,
+                                    time=nt.time)
+        # The new edges are sorted, and their parents are all
+        # younger than those of the simplified edges that we
+        # already have.  Putting the new edges first therefore
+        # gives a sorted table without calling msprime.sort_tables.
+        # The columns are put together in scratch arrays.  Each
+        # edge has one child, so children_length is all ones.
+        nnew = len(et.left)
+        n = nnew + self.__edges.num_rows
+        columns = {}
+        for name, new, dtype in (('left', et.left, np.float64),
+                                 ('right', et.right, np.float64),
+                                 ('parent', et.parent, np.int32),
+                                 ('children', et.child, np.int32)):
+            c = self.__scratch.get(name, n, dtype)
+            c[:nnew] = new
+            if n > nnew:
+                # msprime returns a copy of the column
+                old = getattr(self.__edges, name)
+                copied_bytes += old.nbytes
+                c[nnew:] = old
+            columns[name] = c
+        self.__edges.set_columns(children_length=self.__scratch.get(
+            'ones', n, np.uint32, 1), **columns)
         stop = time.time()
         self.__time_appending += (stop - start)
         start = time.time()
-        msprime.sort_tables(nodes=self.__nodes, edgesets=self.__edges)
+        msprime.simplify_tables(samples=samples, nodes=self.__nodes,
+                                edgesets=self.__edges)
+        # Nodes that were samples before this GC may still
+        # be flagged.  That does not change what msprime
+        # keeps, as we pass the samples, so the flags are
+        # only cleared by finish.
+        self.__num_samples = len(samples)
+        self.__stale_flags = True
+        stop = time.time()
+        self.__time_simplifying += (stop - start)
+        self.__bytes_allocated.append(self.__scratch.bytes_allocated -
+                                      scratch_bytes + copied_bytes)
+        return (True, self.__nodes.num_rows)
+
+    def __move_epoch(self, epoch):
+        # This is the only time that node times are rewritten.
+        # During a simulation, the epoch at least doubles each
+        # time, so this happens a logarithmic number of times.
+        # The flags of nodes that are not samples are cleared.
+        if self.__nodes.num_rows > 0:
+            flags = self.__sample_flags(self.__nodes.num_rows,
+                                        slice(0, self.__num_samples))
+            self.__nodes.set_columns(flags=flags,
+                                     population=self.__nodes.population,
+                                     time=self.__nodes.time +
+                                     (epoch - self.__epoch))
+        self.__epoch = float(epoch)
+        self.__stale_flags = False
+
+    def __sample_flags(self, n, samples):
+        # Flags for n nodes, where only samples are flagged
+        flags = self.__scratch.get('flags', n, np.uint32)
+        flags.fill(0)
+        flags[samples] = 1
+        return flags
+
+    def __simplify_native(self, generation, ancestry):
+        # The tracker keeps the simplified history itself,
+        # and node times stay forwards in time, so msprime
+        # is not needed until export_tables is called.
+        start = time.time()
+        ancestry.sort_edges()
         stop = time.time()
         self.__time_sorting += (stop - start)
         start = time.time()
-        msprime.simplify_tables(samples=samples.tolist(
-        ), nodes=self.__nodes, edgesets=self.__edges)
+        ancestry.simplify(ancestry.samples)
         stop = time.time()
         self.__time_simplifying += (stop - start)
-        return (True, self.__nodes.num_rows)
+        return (True, len(ancestry.nodes))
+
+    def __simplify_background(self, generation, ancestry, record):
+        # The previous buffers have been simplified by now,
+        # as simplify waits for the worker before calling this.
+        # From here until the worker is joined, only the worker
+        # touches the tables, the epoch, the scratch arrays and
+        # the times.  Its results are put in self.__worker_result,
+        # and only read by the main thread after joining it.
+        detached = ancestry.detach_buffers()
+        self.__detached_ids = (detached.samples[0], ancestry.next_index)
+        record['time_simplifying'] = None
+        self.__worker_result = {'record': record}
+        self.__worker = threading.Thread(target=self.__run_worker,
+                                         args=(generation, detached,
+                                               self.__worker_result))
+        self.__worker.start()
+        # Node IDs are unchanged until remap_ids is called
+        return (True, None)
+
+    def __run_worker(self, generation, ancestry, result):
+        start = time.time()
+        try:
+            result['num_rows'] = self.__simplify_msprime(generation,
+                                                         ancestry)[1]
+        except Exception as e:
+            result['error'] = e
+        result['seconds'] = time.time() - start
+
+    def __wait_for_worker(self, ancestry):
+        if self.__worker is None:
+            return
+        self.__worker.join()
+        result = self.__worker_result
+        self.__worker = None
+        self.__worker_result = None
+        result['record']['time_simplifying'] = result['seconds']
+        if 'error' in result:
+            raise result['error']
+        first_sample, first_new_id = self.__detached_ids
+        ancestry.remap_ids(first_sample, first_new_id, result['num_rows'])
+        self.__detached_ids = None
+
+    def wait(self, ancestry):
+        """
+        Wait for any background simplification to finish,
+        and give the nodes recorded since it started their
+        final IDs.  This is called from C++ if the node IDs
+        would otherwise overflow.
+
+        :param ancestry: An instance of AncestryTracker
+        """
+        self.__wait_for_worker(ancestry)
+
+    def finish(self, generation, ancestry):
+        """
+        Simplify whatever remains at the end of a simulation,
+        waiting for any background simplification first.
+
+        :param generation: The generation after the last one simulated.
+        :param ancestry: An instance of AncestryTracker
+        """
+        self.__wait_for_worker(ancestry)
+        self.last_gc_time = generation
+        if ancestry.num_nodes() > 0:
+            if self.__native is True:
+                self.__simplify_native(generation, ancestry)
+            else:
+                self.__simplify_msprime(generation, ancestry)
+        if self.__native is True:
+            self.export_tables(ancestry)
+        else:
+            self.__finish_tables()
+
+    def __finish_tables(self):
+        # Shift node times so that the samples are at time 0,
+        # and clear the flags of nodes that are no longer samples.
+        if self.__time_offset != 0.0 or self.__stale_flags is True:
+            self.__move_epoch(self.__epoch - self.__time_offset)
+            self.__time_offset = 0.0
+
+    def export_tables(self, ancestry):
+        """
+        Fill nodes and edgesets from an AncestryTracker
+        that has been simplified using AncestryTracker.simplify.
+
+        :param ancestry: An instance of AncestryTracker
+        """
+        start = time.time()
+        na = np.array(ancestry.nodes, copy=False)
+        ea = np.array(ancestry.edges, copy=False)
+        # Convert forward time to backwards time:
+        tc = na['generation'].max() - na['generation']
+        # Only the current samples are flagged:
+        samples = np.array(ancestry.samples, copy=False)
+        self.__nodes.set_columns(flags=self.__sample_flags(len(na), samples),
+                                 population=na['population'],
+                                 time=tc)
+        self.__num_samples = len(samples)
+        # children_length is all ones, because each edge has one child:
+        ones = self.__scratch.get('ones', len(ea), np.uint32, 1)
+        # Node IDs may be 64-bit in C++, but msprime's are
+        # 32-bit.  After simplification, they all fit.
+        if len(na) > np.iinfo(np.int32).max:
+            raise RuntimeError("too many nodes for msprime's 32-bit IDs")
+        self.__edges.set_columns(left=ea['left'],
+                                 right=ea['right'],
+                                 parent=ea['parent'].astype(np.int32),
+                                 children=ea['child'].astype(np.int32),
+                                 children_length=ones)
+        stop = time.time()
+        self.__time_appending += (stop - start)
 
     def __call__(self, generation, ancestry):
         """
-        This is called from C++ during a simulation.
+        Simplify if generation is a multiple of gc_interval.
+        During a simulation, the C++ side decides when to
+        simplify, using a GCPolicy, and calls simplify directly.
 
         :param generation: Current generation in a simulation.
         :param ancestry: An instance of AncestryTracker
@@ -87,6 +524,10 @@ class ArgSimplifier(object):
     def nodes(self):
         """
         A NumPy record array representing the nodes.
+        After finish, the samples are at time 0, and only
+        they are flagged.  Before then, times are relative
+        to an earlier generation, and nodes that were once
+        samples may still be flagged.
         """
         return self.__nodes
 
@@ -97,6 +538,20 @@ class ArgSimplifier(object):
         """
         return self.__edges
 
+    @property
+    def native(self):
+        """
+        True if simplification is done by AncestryTracker.simplify
+        """
+        return self.__native
+
+    @property
+    def background(self):
+        """
+        True if simplification with msprime runs in a separate thread
+        """
+        return self.__background
+
     @property
     def gc_interval(self):
         """
@@ -125,6 +580,43 @@ class ArgSimplifier(object):
     def last_gc_time(self, value):
         self.__last_gc_time = float(value)
 
+    @property
+    def adaptive_gc(self):
+        """
+        The AdaptiveGC schedule, or None
+        """
+        return self.__adaptive_gc
+
+    @property
+    def gc_records(self):
+        """
+        A list with a dict for each GC during a simulation.
+        The keys are generation, generations (since the last
+        GC), pending_edges and tracker_bytes (before the GC),
+        table_nodes, table_edges and table_bytes (the rows
+        of the simplified history, and an estimate of its
+        size, after the GC, or after the previous GC with
+        background simplification),
+        time_simulating (since the last GC) and
+        time_simplifying.  With background simplification,
+        time_simplifying is the worker thread's time, and is
+        None until the worker has been joined, and time_waiting
+        is the time that the simulation was stopped for.
+        If gc_policy is set, interval and
+        max_edges are its values for the next GC, after any
+        change made by adaptive_gc.
+        """
+        return list(self.__gc_records)
+
+    @property
+    def bytes_allocated(self):
+        """
+        A list of the number of bytes allocated by each GC with msprime,
+        for scratch arrays and for copies of msprime's columns.
+        Scratch arrays are kept, so this drops once they are big enough.
+        """
+        return list(self.__bytes_allocated)
+
     @property
     def times(self):
         """
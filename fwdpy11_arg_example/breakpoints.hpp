@@ -0,0 +1,84 @@
+// This file defines how recombination breakpoints are
+// generated during a simulation.  It does the same thing
+// as fwdpp's discrete_rec_model, drawing the same random
+// numbers in the same order.  The difference is that the
+// breakpoints are written to a buffer that is reused for
+// every meiosis, rather than to a new vector each time.
+
+#ifndef ANCESTRY_BREAKPOINTS_HPP__
+#define ANCESTRY_BREAKPOINTS_HPP__
+
+#include <algorithm>
+#include <limits>
+#include <stdexcept>
+#include <vector>
+#include <gsl/gsl_randist.h>
+#include <fwdpp/internal/gsl_discrete.hpp>
+
+struct breakpoint_generator
+{
+    /// Region beginnings and ends:
+    std::vector<double> beg, end;
+    KTfwd::fwdpp_internal::gsl_ran_discrete_t_ptr lookup;
+    /// Mean number of breakpoints per meiosis:
+    const double recrate;
+    breakpoint_generator(std::vector<double> region_beg,
+                         std::vector<double> region_end,
+                         const std::vector<double>& region_weight,
+                         const double rate)
+        : beg(std::move(region_beg)), end(std::move(region_end)), lookup{},
+          recrate{ rate }
+    {
+        if (beg.size() != end.size() || beg.size() != region_weight.size())
+            {
+                throw std::invalid_argument(
+                    "recombination regions: unequal container sizes");
+            }
+        if (recrate > 0. && beg.empty())
+            {
+                throw std::invalid_argument(
+                    "recombination rate > 0 but no recombination regions");
+            }
+        if (!region_weight.empty())
+            {
+                lookup = KTfwd::fwdpp_internal::gsl_ran_discrete_t_ptr(
+                    gsl_ran_discrete_preproc(region_weight.size(),
+                                             region_weight.data()));
+            }
+    }
+
+    unsigned
+    nbreakpoints(const gsl_rng* r) const
+    {
+        return gsl_ran_poisson(r, recrate);
+    }
+
+    void
+    positions(const gsl_rng* r, const unsigned nbreaks,
+              std::vector<double>& breakpoints) const
+    /// Fills breakpoints with nbreaks positions, which
+    /// are sorted and followed by a sentinel value, as
+    /// fwdpp requires.  If nbreaks is 0, breakpoints is empty.
+    {
+        breakpoints.clear();
+        if (!nbreaks)
+            return;
+        for (unsigned i = 0; i < nbreaks; ++i)
+            {
+                const auto region = gsl_ran_discrete(r, lookup.get());
+                breakpoints.push_back(
+                    gsl_ran_flat(r, beg[region], end[region]));
+            }
+        std::sort(breakpoints.begin(), breakpoints.end());
+        breakpoints.push_back(std::numeric_limits<double>::max());
+    }
+
+    void
+    operator()(const gsl_rng* r, std::vector<double>& breakpoints) const
+    /// Fills breakpoints for one meiosis.  See positions.
+    {
+        positions(r, nbreakpoints(r), breakpoints);
+    }
+};
+
+#endif
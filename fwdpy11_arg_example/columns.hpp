@@ -0,0 +1,141 @@
+// This file defines columnar (structure-of-arrays) copies
+// of nodes and edges.  msprime's tables store each column
+// contiguously, so these can be appended to them without
+// NumPy having to gather strided fields from the arrays of
+// node and edge structs.  They are exposed to Python as
+// wfarg.NodeColumns and wfarg.EdgeColumns.
+//
+// These are a staging copy, not the primary storage: the
+// simulation records nodes and edges as structs, and
+// prep_for_gc copies them into the columns at each GC.
+// That copy replaces the one that NumPy would otherwise
+// make when gathering the fields; it does not remove it.
+
+#ifndef ANCESTRY_COLUMNS_HPP__
+#define ANCESTRY_COLUMNS_HPP__
+
+#include <cstdint>
+#include <vector>
+
+#include "node.hpp"
+#include "edge.hpp"
+#include "compact.hpp"
+
+struct node_columns
+{
+    std::vector<double> time;
+    std::vector<std::int32_t> population;
+    /// msprime's node flags.  Only the samples
+    /// are flagged, by flag_samples.
+    std::vector<std::uint32_t> flags;
+
+    void
+    fill(const std::vector<node>& nodes, const double epoch)
+    /// Node times are converted from forward time
+    /// to backwards time, measured from epoch.
+    {
+        time.resize(nodes.size());
+        population.resize(nodes.size());
+        flags.assign(nodes.size(), 0);
+        for (std::size_t i = 0; i < nodes.size(); ++i)
+            {
+                time[i] = epoch - nodes[i].generation;
+                population[i] = nodes[i].population;
+            }
+    }
+
+    void
+    fill(const std::vector<compact_node>& nodes, const double epoch)
+    {
+        time.resize(nodes.size());
+        population.resize(nodes.size());
+        flags.assign(nodes.size(), 0);
+        for (std::size_t i = 0; i < nodes.size(); ++i)
+            {
+                time[i] = epoch - nodes[i].generation;
+                population[i] = nodes[i].population;
+            }
+    }
+
+    template <typename integer_type>
+    void
+    flag_samples(const std::vector<integer_type>& samples,
+                 const integer_type first_id)
+    /// Flag the samples as such.  The node in
+    /// row i has ID first_id + i.
+    {
+        for (auto&& s : samples)
+            {
+                if (s >= first_id
+                    && static_cast<std::size_t>(s - first_id) < flags.size())
+                    {
+                        flags[s - first_id] = 1;
+                    }
+            }
+    }
+
+    void
+    clear()
+    {
+        time.clear();
+        population.clear();
+        flags.clear();
+    }
+};
+
+struct edge_columns
+{
+    std::vector<double> left, right;
+    /// msprime's node IDs are 32-bit, so 64-bit IDs are
+    /// narrowed.  See ancestry_tracker::prep_for_gc.
+    std::vector<std::int32_t> parent, child;
+    /// msprime's edgeset children_length.  Each edge has one child.
+    std::vector<std::uint32_t> children_length;
+
+    void
+    fill(const std::vector<edge>& edges)
+    {
+        left.resize(edges.size());
+        right.resize(edges.size());
+        parent.resize(edges.size());
+        child.resize(edges.size());
+        children_length.assign(edges.size(), 1);
+        for (std::size_t i = 0; i < edges.size(); ++i)
+            {
+                left[i] = edges[i].left;
+                right[i] = edges[i].right;
+                parent[i] = static_cast<std::int32_t>(edges[i].parent);
+                child[i] = static_cast<std::int32_t>(edges[i].child);
+            }
+    }
+
+    void
+    fill(const std::vector<compact_edge>& edges)
+    /// Positions are decoded to doubles.
+    {
+        left.resize(edges.size());
+        right.resize(edges.size());
+        parent.resize(edges.size());
+        child.resize(edges.size());
+        children_length.assign(edges.size(), 1);
+        for (std::size_t i = 0; i < edges.size(); ++i)
+            {
+                left[i] = decode_position(edges[i].left);
+                right[i] = decode_position(edges[i].right);
+                parent[i] = static_cast<std::int32_t>(edges[i].parent);
+                child[i] = static_cast<std::int32_t>(edges[i].child);
+            }
+    }
+
+    void
+    clear()
+    {
+        left.clear();
+        right.clear();
+        parent.clear();
+        child.clear();
+        children_length.clear();
+    }
+};
+
+#endif
@@ -0,0 +1,92 @@
+// This file defines compact encodings of nodes and edges.
+// A node's ID is its index in the tracker's buffer plus the
+// ID of the first node, so it is not stored, and generations
+// are integers.  Positions are stored as 32-bit fixed-point
+// numbers on [0,1], which resolves about 2.3e-10.  Nodes take
+// 8 bytes instead of 16, and edges 16 bytes instead of 24
+// (or 24 instead of 32 with 64-bit node IDs).
+// They are decoded into msprime's columns by prep_for_gc.
+
+#ifndef ANCESTRY_COMPACT_HPP__
+#define ANCESTRY_COMPACT_HPP__
+
+#include <algorithm>
+#include <cstdint>
+#include <tuple>
+#include <vector>
+#include "node_id.hpp"
+
+struct compact_node
+{
+    std::int32_t generation, population;
+};
+
+struct compact_edge
+{
+    std::uint32_t left, right;
+    node_id_t parent, child;
+};
+
+/// 1.0 is encoded as the largest 32-bit value,
+/// so that 0 and 1 are both decoded exactly.
+constexpr double compact_position_scale = 4294967295.0;
+
+inline std::uint32_t
+encode_position(const double x)
+{
+    return static_cast<std::uint32_t>(
+        std::min(std::max(x, 0.0), 1.0) * compact_position_scale + 0.5);
+}
+
+inline double
+decode_position(const std::uint32_t x)
+{
+    return x / compact_position_scale;
+}
+
+inline compact_node
+make_compact_node(std::int32_t generation, std::int32_t population)
+{
+    compact_node n;
+    n.generation = generation;
+    n.population = population;
+    return n;
+}
+
+inline bool
+append_edge(std::vector<compact_edge>& edges, const double left,
+            const double right, const node_id_t parent,
+            const node_id_t child)
+/// Positions closer than the resolution of the encoding
+/// give an empty edge, which is not added.  The edges on
+/// either side of it then abut and have the same parent
+/// and child, so the last edge is extended instead of
+/// adding a new one, and true is returned.
+{
+    compact_edge e;
+    e.left = encode_position(left);
+    e.right = encode_position(right);
+    if (!(e.right > e.left))
+        return false;
+    if (!edges.empty() && edges.back().right == e.left
+        && edges.back().parent == parent && edges.back().child == child)
+        {
+            edges.back().right = e.right;
+            return true;
+        }
+    e.parent = parent;
+    e.child = child;
+    edges.push_back(e);
+    return false;
+}
+
+// The encoding keeps the order of positions,
+// so compact edges sort the same way as edges.
+inline auto
+get_tied_edge_msprime(const compact_edge& e, const double& parent_time)
+    -> decltype(std::tie(parent_time, e.parent, e.child, e.left))
+{
+    return std::tie(parent_time, e.parent, e.child, e.left);
+}
+
+#endif
@@ -0,0 +1,54 @@
+// This file defines the random draws that can be made
+// for a whole generation before any offspring are made.
+// Drawing them in tight loops over flat arrays, rather
+// than interleaved with the work of making each offspring,
+// is kinder to the cache.
+
+#ifndef ANCESTRY_DRAWS_HPP__
+#define ANCESTRY_DRAWS_HPP__
+
+#include <cstddef>
+#include <vector>
+#include <gsl/gsl_rng.h>
+#include <fwdpy11/rng.hpp>
+#include "breakpoints.hpp"
+
+struct generation_draws
+{
+    /// Two parents per offspring:
+    std::vector<std::size_t> parents;
+    /// Two Mendel swaps per offspring:
+    std::vector<int> swaps;
+    /// Number of breakpoints in each of the
+    /// two meioses per offspring:
+    std::vector<unsigned> nbreakpoints;
+
+    template <typename pick1_function, typename pick2_function>
+    void
+    draw(const fwdpy11::GSLrng_t& rng, const std::size_t N_next,
+         const pick1_function& pick1, const pick2_function& pick2,
+         const breakpoint_generator& recmodel)
+    /// pick1(rng) returns the first parent, and
+    /// pick2(rng, p1) returns the second.  Memory is
+    /// kept from one generation to the next.
+    {
+        parents.resize(2 * N_next);
+        swaps.resize(2 * N_next);
+        nbreakpoints.resize(2 * N_next);
+        for (std::size_t i = 0; i < parents.size(); i += 2)
+            {
+                parents[i] = pick1(rng);
+                parents[i + 1] = pick2(rng, parents[i]);
+            }
+        for (auto& s : swaps)
+            {
+                s = (gsl_rng_uniform(rng.get()) < 0.5) ? 1 : 0;
+            }
+        for (auto& n : nbreakpoints)
+            {
+                n = recmodel.nbreakpoints(rng.get());
+            }
+    }
+};
+
+#endif
@@ -3,15 +3,17 @@
 
 #include <cstdint>
 #include <tuple>
+#include <vector>
+#include "node_id.hpp"
 
 struct edge
 {
     double left, right;
-    std::int32_t parent, child;
+    node_id_t parent, child;
 };
 
 inline edge
-make_edge(double left, double right, std::int32_t parent, std::int32_t child)
+make_edge(double left, double right, node_id_t parent, node_id_t child)
 {
     edge e;
     e.left = left;
@@ -21,6 +23,23 @@ make_edge(double left, double right, std::int32_t parent, std::int32_t child)
     return e;
 }
 
+inline bool
+append_edge(std::vector<edge>& edges, const double left, const double right,
+            const node_id_t parent, const node_id_t child)
+/// Empty edges are not added.  Always returns false.
+/// Breakpoints are unique, so a child's consecutive edges
+/// alternate between its parent's two nodes, and there is
+/// never an abutting edge of the same parent and child to
+/// extend.  The return value matches append_edge for
+/// compact edges, where rounding can make edges abut.
+{
+    if (right > left)
+        {
+            edges.emplace_back(make_edge(left, right, parent, child));
+        }
+    return false;
+}
+
 inline auto
 get_tied_edge(const edge& e)
     -> decltype(std::tie(e.child, e.parent, e.left, e.right))
@@ -28,6 +47,16 @@ get_tied_edge(const edge& e)
     return std::tie(e.child, e.parent, e.left, e.right);
 }
 
+// msprime wants edges sorted by parent time,
+// then parent, child, and left.  Edges do not
+// know their parent's time, so the caller supplies it.
+inline auto
+get_tied_edge_msprime(const edge& e, const double& parent_time)
+    -> decltype(std::tie(parent_time, e.parent, e.child, e.left))
+{
+    return std::tie(parent_time, e.parent, e.child, e.left);
+}
+
 inline bool
 operator<(const edge& lhs, const edge& rhs)
 {
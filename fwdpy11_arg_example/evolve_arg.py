@@ -1,3 +1,4 @@
+import copy
 import fwdpy11
 import fwdpy11.fitness
 import fwdpy11.model_params
@@ -5,7 +6,11 @@ import numpy as np
 import msprime
 
 
-def evolve_track(rng, pop, params, gc_interval):
+def evolve_track(rng, pop, params, gc_interval, presort_edges=False,
+                 native_simplify=False, prune_extinct=False, gc_max_edges=0,
+                 background_simplify=False, defer_edges=False, nthreads=1,
+                 batch_draws=False, compact=False, shrink_factor=0.0,
+                 stats_generations=0, adaptive_gc=None):
     """
     Evolve a population and track its ancestry using msprime.
 
@@ -13,6 +18,27 @@ def evolve_track(rng, pop, params, gc_interval):
     :param pop: A fwdpy11.SlocusPop
     :param params: A fwdpy11.SlocusParams
     :param gc_interval: An integer representing how often to simplify the ancestry.
+    :param presort_edges: If True, edges are sorted each generation, so that no sorting is needed when simplifying.
+    :param native_simplify: If True, simplify in C++ and only use msprime to export the final result.
+    :param prune_extinct: If True, remove nodes that leave no offspring, and their edges, every generation.  Only the parental generation is pruned: a grandparent whose only children are removed this way is kept until the next GC.
+    :param gc_max_edges: If nonzero, also simplify whenever this many edges are waiting to be simplified.
+    :param background_simplify: If True, simplify with msprime in a separate thread while the simulation continues.
+    :param defer_edges: If True, record each meiosis compactly and only make edges when simplifying, skipping children with no descendants.
+    :param nthreads: Number of threads used to make offspring.  If 0, the number of hardware threads is used.  Results depend on the seed, but not on the number of threads, as long as it is more than one.
+    :param batch_draws: If True, each generation's parents, Mendel swaps and numbers of crossovers are drawn before any offspring are made.  This gives different results for the same seed.  It is ignored if nthreads is more than one.
+    :param compact: If True, store nodes and edges in a compact form until they are simplified, using about half the memory.  Positions are rounded to about 2.3e-10.  This cannot be combined with native_simplify.
+    :param shrink_factor: If nonzero, after each GC, free the memory of any tracker buffer, including the columns handed to msprime, whose capacity is more than shrink_factor times what the generations until the next GC need.
+    :param stats_generations: If nonzero, the AncestryTracker records counters for each generation, keeping those of the last stats_generations generations in AncestryTracker.stats.
+    :param adaptive_gc: If not None, an instance of argsimplifier.AdaptiveGC, such as EdgeBudget, MemoryBudget or TimeRatio, which changes the GC interval and edge limit after each GC.  gc_interval is used until the first GC.  What was measured and decided at each GC is in ArgSimplifier.gc_records.
+
+    .. note::
+        The tracker's buffers are reserved for the population sizes in params.demography
+        up to the next GC, at the start and after each GC.
+
+    .. note::
+        If the selected mutation rate is 0, the simulation only tracks the ancestry,
+        which is much faster.  Offspring are then made by one thread.  At the end,
+        all diploids carry two copies of the same, empty, gamete.
 
     :rtype: tuple
 
@@ -36,27 +62,198 @@ def evolve_track(rng, pop, params, gc_interval):
     if any(i.b < 0.0 for i in params.sregions) is True:
         raise RuntimeError("Minimum possible position is 0.0")
 
-    from fwdpy11.internal import makeMutationRegions, makeRecombinationRegions
+    from fwdpy11.internal import makeMutationRegions
     mm = makeMutationRegions(params.nregions, params.sregions)
-    rm = makeRecombinationRegions(params.recregions)
+    # Recombination breakpoints are generated in C++
+    # from the regions' beginnings, ends, and weights:
+    rec_beg = [i.b for i in params.recregions]
+    rec_end = [i.e for i in params.recregions]
+    rec_weight = [i.w for i in params.recregions]
+
+    if compact is True and native_simplify is True:
+        raise ValueError("compact storage and native simplification "
+                         "cannot be combined")
 
-    from .wfarg import evolve_singlepop_regions_track_ancestry, AncestryTracker
+    from .wfarg import evolve_singlepop_regions_track_ancestry, AncestryTracker, GCPolicy
     from .argsimplifier import ArgSimplifier
-    simplifier = ArgSimplifier(gc_interval)
-    atracker = AncestryTracker(pop.N)
+    simplifier = ArgSimplifier(gc_interval, native_simplify,
+                               background_simplify, adaptive_gc)
+    # The GC schedule is checked in C++, so that the simplifier
+    # is only called from C++ when it is time to simplify.
+    # The simplifier may change it after each GC.
+    gc_policy = GCPolicy(simplifier.gc_interval, gc_max_edges)
+    if adaptive_gc is not None:
+        adaptive_gc.start(gc_policy)
+    simplifier.gc_policy = gc_policy
+    atracker = AncestryTracker(pop.N, presort_edges, defer_edges,
+                               compact)
+    atracker.prune_extinct = prune_extinct
+    # Unless msprime simplifies, node IDs only
+    # have to fit in the tracker's integer type:
+    atracker.msprime_ids = not native_simplify
+    atracker.shrink_factor = shrink_factor
+    if stats_generations > 0:
+        atracker.enable_stats(stats_generations)
     tsim = evolve_singlepop_regions_track_ancestry(rng, pop, atracker, simplifier,
+                                                   gc_policy,
                                                    params.demography,
                                                    params.mutrate_s,
-                                                   params.recrate, mm, rm,
-                                                   params.gvalue, params.pself)
-    if len(atracker.nodes) > 0:
-        # TODO
-        # The + 1 is b/c we have a bit of a book-keeping
-        # thing that we need to document...
-        simplifier.simplify(pop.generation + 1, atracker)
+                                                   params.recrate, mm,
+                                                   rec_beg, rec_end,
+                                                   rec_weight,
+                                                   params.gvalue, params.pself,
+                                                   nthreads, batch_draws)
+    # TODO
+    # The + 1 is b/c we have a bit of a book-keeping
+    # thing that we need to document...
+    simplifier.finish(pop.generation + 1, atracker)
     return (simplifier, atracker, tsim)
 
 
+# Results of autotune_gc_interval, keyed by parameter set
+_autotune_cache = {}
+
+
+def _object_key(obj):
+    # The type and public data of obj.  Unlike repr,
+    # this does not include the object's address when
+    # the type does not define __repr__.
+    cls = type(obj)
+    attrs = []
+    for name in sorted(dir(obj)):
+        if not name.startswith('_'):
+            value = getattr(obj, name)
+            if not callable(value):
+                attrs.append((name, repr(value)))
+    return (cls.__module__, cls.__name__, tuple(attrs))
+
+
+def _autotune_key(popsize, params, candidates, pilot_generations,
+                  max_bytes, seed, kwargs):
+    return (popsize, params.mutrate_n, params.mutrate_s, params.recrate,
+            params.pself,
+            tuple(_object_key(r) for r in params.nregions),
+            tuple(_object_key(r) for r in params.sregions),
+            tuple(_object_key(r) for r in params.recregions),
+            _object_key(params.gvalue),
+            np.asarray(params.demography, dtype=np.uint32).tobytes(),
+            tuple(candidates), pilot_generations, max_bytes, seed,
+            tuple(sorted(kwargs.items())))
+
+
+def _choose_interval(candidates, seconds, peak_bytes, max_bytes=None):
+    # Fit the pilots' time per generation and peak memory,
+    # and return the interval with the least projected time
+    # of those projected to use at most max_bytes.
+    x = np.array(candidates, dtype=np.float64)
+    if len(candidates) < 3:
+        # Too few points to fit the model
+        trials = x
+        projected_seconds = np.array(seconds)
+        projected_bytes = np.array(peak_bytes, dtype=np.float64)
+    else:
+        trials = np.arange(candidates[0], candidates[-1] + 1,
+                           dtype=np.float64)
+        a = np.vstack([np.ones(len(x)), 1.0 / x, x]).T
+        coefs = np.linalg.lstsq(a, np.array(seconds), rcond=-1)[0]
+        projected_seconds = coefs[0] + coefs[1] / trials + coefs[2] * trials
+        slope, intercept = np.polyfit(x, np.array(peak_bytes,
+                                                  dtype=np.float64), 1)
+        projected_bytes = intercept + slope * trials
+    if max_bytes is not None:
+        fits = projected_bytes <= max_bytes
+        if not fits.any():
+            raise ValueError("no GC interval is projected to "
+                             "use at most max_bytes")
+        trials = trials[fits]
+        projected_seconds = projected_seconds[fits]
+    return int(trials[np.argmin(projected_seconds)])
+
+
+def autotune_gc_interval(params, popsize=None, candidates=None,
+                         pilot_generations=None, max_bytes=None, seed=42,
+                         **kwargs):
+    """
+    Choose a GC interval for evolve_track from short pilot simulations.
+
+    Each candidate interval is used for a simulation of the first
+    pilot_generations generations of params.demography.  The time per
+    generation, from the time spent simulating plus ArgSimplifier.times,
+    is fit as a + b/interval + c*interval: GCs have a cost that does
+    not depend on how many edges they simplify, while longer intervals
+    mean bigger buffers.  The peak memory, from ArgSimplifier.gc_records,
+    is fit as linear in the interval.  The interval between the smallest
+    and largest candidates with the least projected time, and a projected
+    peak memory of at most max_bytes, is returned.
+
+    The pilots simulate len(candidates) * pilot_generations generations
+    in total.  With the default candidates and pilot_generations, that
+    is about a tenth of the generations in params.demography, and the
+    pilots are at least five times the largest candidate.  Results are
+    cached, so calling this again with the same arguments does not run
+    any simulations.  If there is only one candidate, it is returned
+    without running any.
+
+    :param params: A fwdpy11.SlocusParams
+    :param popsize: The initial diploid population size.  If None, params.demography[0] is used.
+    :param candidates: The intervals to try.  If None, intervals from 2 up to a five-hundredth of the length of params.demography are used.
+    :param pilot_generations: The number of generations in each pilot.  If None, a tenth of the length of params.demography divided by the number of candidates, but at least five times the largest candidate.
+    :param max_bytes: If not None, the most memory that the tracker and tables may use.
+    :param seed: The RNG seed for the pilots.
+    :param kwargs: Passed on to evolve_track, so that the pilots use the same options as the real simulation.
+
+    :rtype: int
+
+    :return: The GC interval
+    """
+    demography = np.array(params.demography, dtype=np.uint32)
+    if popsize is None:
+        popsize = int(demography[0])
+    if candidates is None:
+        # Interval 1 is left out, as it is never the fastest
+        # for long simulations, and its pilot is the slowest.
+        candidates = [i for i in (2, 5, 10, 20, 50, 100, 200, 500, 1000)
+                      if i <= len(demography) // 500] or \
+            [max(len(demography) // 50, 1)]
+    candidates = sorted(set(int(i) for i in candidates))
+    if len(candidates) == 0 or candidates[0] < 1:
+        raise ValueError("candidate GC intervals must be integers > 0")
+    if len(candidates) == 1:
+        return candidates[0]
+    if pilot_generations is None:
+        pilot_generations = min(len(demography),
+                                max(len(demography) // (10 * len(candidates)),
+                                    5 * candidates[-1]))
+    if pilot_generations < 1:
+        raise ValueError("pilot_generations must be > 0")
+
+    key = _autotune_key(popsize, params, candidates, pilot_generations,
+                        max_bytes, seed, kwargs)
+    if key in _autotune_cache:
+        return _autotune_cache[key]
+
+    # The pilots use a copy of params, so that the
+    # caller's demography is never changed.
+    pilot_params = copy.copy(params)
+    pilot_params.demography = demography[:pilot_generations]
+    seconds, peak_bytes = [], []
+    for interval in candidates:
+        pop = fwdpy11.SlocusPop(popsize)
+        rng = fwdpy11.GSLrng(seed)
+        simplifier, atracker, tsim = evolve_track(
+            rng, pop, pilot_params, interval, **kwargs)
+        seconds.append((tsim + sum(simplifier.times.values())) /
+                       float(pilot_generations))
+        records = simplifier.gc_records
+        peak_bytes.append(max([r['tracker_bytes'] for r in records] +
+                              [atracker.memory_used()]) +
+                          max([r['table_bytes'] for r in records] + [0]))
+
+    interval = _choose_interval(candidates, seconds, peak_bytes, max_bytes)
+    _autotune_cache[key] = interval
+    return interval
+
+
 def evolve_track_wrapper(popsize=1000, rho=10000.0, mu=1e-2, seed=42,
                          gc_interval=10,
                          dfe=fwdpy11.ConstantS(0, 1, 1, -0.025, 1.0)):
@@ -4,6 +4,8 @@
 #include <cstddef>
 #include <iostream>
 #include <algorithm>
+#include <atomic>
+#include <thread>
 #include <type_traits>
 #include <tuple>
 #include <queue>
@@ -16,6 +18,8 @@
 #include <fwdpy11/rng.hpp>
 #include "ancestry_tracker.hpp"
 #include "handle_recombination.hpp"
+#include "breakpoints.hpp"
+#include "draws.hpp"
 
 // This is a copy/paste + modification of fwdpy11's
 // existing function to evolve a single-deme, single-region
@@ -31,6 +35,7 @@ evolve_generation(const fwdpy11::GSLrng_t& rng, poptype& pop,
                   const recombination_model& recmodel,
                   const pick1_function& pick1, const pick2_function& pick2,
                   const update_function& update, ancestry_tracker& ancestry,
+                  typename poptype::dipvector_t& offspring,
                   const mutation_removal_policy& mrp)
 {
     static_assert(std::is_same<typename poptype::popmodel_t,
@@ -50,7 +55,9 @@ evolve_generation(const fwdpy11::GSLrng_t& rng, poptype& pop,
     for (auto&& g : pop.gametes)
         g.n = 0;
 
-    decltype(pop.diploids) offspring(N_next);
+    // offspring holds the diploids from two generations
+    // ago, so resizing it does not normally allocate.
+    offspring.resize(N_next);
 
     // Generate the offspring
     std::size_t label = 0;
@@ -71,16 +78,17 @@ evolve_generation(const fwdpy11::GSLrng_t& rng, poptype& pop,
             if (swap2)
                 std::swap(p2g1, p2g2);
 
-            auto breakpoints = recmodel(pop.gametes[p1g1], pop.gametes[p1g2],
-                                        pop.mutations);
+            // The breakpoints are written to scratch space
+            // owned by the tracker, which is reused:
+            auto& breakpoints = ancestry.breakpoints;
+            recmodel(breakpoints);
             auto pid = ancestry.get_parent_ids(p1, swap1);
             auto offspring_indexes = ancestry.get_next_indexes();
 
             dip.first = ancestry_recombination_details(
                 pop, ancestry, gamete_recycling_bin, p1g1, p1g2, breakpoints,
                 pid, std::get<0>(offspring_indexes));
-            breakpoints = recmodel(pop.gametes[p2g1], pop.gametes[p2g2],
-                                   pop.mutations);
+            recmodel(breakpoints);
             pid = ancestry.get_parent_ids(p2, swap2);
 
             dip.second = ancestry_recombination_details(
@@ -114,4 +122,261 @@ evolve_generation(const fwdpy11::GSLrng_t& rng, poptype& pop,
     pop.diploids.swap(offspring);
 }
 
+// This does the same as evolve_generation, except that the
+// parents, Mendel swaps, and numbers of breakpoints are all
+// drawn before any offspring are made.  The loop over the
+// offspring then reads them from the flat arrays in draws.
+template <typename poptype, typename pick1_function, typename pick2_function,
+          typename update_function, typename mutation_model,
+          typename mutation_removal_policy>
+void
+evolve_generation_batched(
+    const fwdpy11::GSLrng_t& rng, poptype& pop, const KTfwd::uint_t N_next,
+    const double mu, const mutation_model& mmodel,
+    const breakpoint_generator& recmodel, const pick1_function& pick1,
+    const pick2_function& pick2, const update_function& update,
+    ancestry_tracker& ancestry, typename poptype::dipvector_t& offspring,
+    generation_draws& draws, const mutation_removal_policy& mrp)
+{
+    static_assert(std::is_same<typename poptype::popmodel_t,
+                               KTfwd::sugar::SINGLEPOP_TAG>::value,
+                  "Population type must be a single-locus, single-deme type.");
+
+    draws.draw(rng, N_next,
+               [&pick1, &pop](const fwdpy11::GSLrng_t& r) {
+                   return pick1(r, pop);
+               },
+               [&pick2, &pop](const fwdpy11::GSLrng_t& r,
+                              const std::size_t p1) {
+                   return pick2(r, pop, p1);
+               },
+               recmodel);
+
+    auto gamete_recycling_bin
+        = KTfwd::fwdpp_internal::make_gamete_queue(pop.gametes);
+    auto mutation_recycling_bin
+        = KTfwd::fwdpp_internal::make_mut_queue(pop.mcounts);
+    for (auto&& g : pop.gametes)
+        g.n = 0;
+    offspring.resize(N_next);
+
+    auto& breakpoints = ancestry.breakpoints;
+    auto make_gamete = [&](const std::size_t i,
+                           const ancestry_tracker::integer_type child) {
+        const auto parent = draws.parents[i];
+        const auto swap = draws.swaps[i];
+        auto g1 = pop.diploids[parent].first;
+        auto g2 = pop.diploids[parent].second;
+        if (swap)
+            std::swap(g1, g2);
+        recmodel.positions(rng.get(), draws.nbreakpoints[i], breakpoints);
+        return ancestry_recombination_details(
+            pop, ancestry, gamete_recycling_bin, g1, g2, breakpoints,
+            ancestry.get_parent_ids(parent, swap), child);
+    };
+    std::size_t label = 0;
+    for (auto& dip : offspring)
+        {
+            const auto i = 2 * label;
+            auto offspring_indexes = ancestry.get_next_indexes();
+            dip.first = make_gamete(i, std::get<0>(offspring_indexes));
+            dip.second = make_gamete(i + 1, std::get<1>(offspring_indexes));
+
+            pop.gametes[dip.first].n++;
+            pop.gametes[dip.second].n++;
+
+            // now, add new mutations
+            dip.first = KTfwd::mutate_gamete_recycle(
+                mutation_recycling_bin, gamete_recycling_bin, rng.get(), mu,
+                pop.gametes, pop.mutations, dip.first, mmodel,
+                KTfwd::emplace_back());
+            dip.second = KTfwd::mutate_gamete_recycle(
+                mutation_recycling_bin, gamete_recycling_bin, rng.get(), mu,
+                pop.gametes, pop.mutations, dip.second, mmodel,
+                KTfwd::emplace_back());
+
+            assert(pop.gametes[dip.first].n);
+            assert(pop.gametes[dip.second].n);
+            dip.label = label++;
+            update(rng, dip, pop, draws.parents[i], draws.parents[i + 1]);
+        }
+    ancestry.finish_generation();
+    KTfwd::fwdpp_internal::process_gametes(pop.gametes, pop.mutations,
+                                           pop.mcounts);
+    KTfwd::fwdpp_internal::gamete_cleaner(pop.gametes, pop.mutations,
+                                          pop.mcounts, 2 * N_next, mrp);
+    // This is constant-time
+    pop.diploids.swap(offspring);
+}
+
+// Offspring are made in blocks of this size when a
+// generation is made in parallel.  Each block has its
+// own random number seed, so that the results do not
+// depend on the number of threads.
+constexpr std::size_t offspring_block_size = 1024;
+
+// This does the same as evolve_generation, using one thread
+// per element of thread_rngs.  Parents, breakpoints, and
+// ancestry are made for each block of offspring in parallel.
+// Each thread reseeds its own random number generator for every
+// block that it makes.  The offspring's gametes are then made
+// serially, because fwdpp's gamete and mutation containers are
+// shared.  Mutations use rng, which also seeds the blocks.
+// threads holds the worker threads, and is passed in so
+// that its memory is kept from one generation to the next.
+template <typename poptype, typename pick1_function, typename pick2_function,
+          typename update_function, typename mutation_model,
+          typename mutation_removal_policy>
+void
+evolve_generation_parallel(
+    const fwdpy11::GSLrng_t& rng,
+    const std::vector<fwdpy11::GSLrng_t>& thread_rngs,
+    std::vector<std::thread>& threads, poptype& pop,
+    const KTfwd::uint_t N_next, const double mu, const mutation_model& mmodel,
+    const breakpoint_generator& recmodel, const pick1_function& pick1,
+    const pick2_function& pick2, const update_function& update,
+    ancestry_tracker& ancestry, typename poptype::dipvector_t& offspring,
+    const mutation_removal_policy& mrp)
+{
+    static_assert(std::is_same<typename poptype::popmodel_t,
+                               KTfwd::sugar::SINGLEPOP_TAG>::value,
+                  "Population type must be a single-locus, single-deme type.");
+
+    const std::size_t nblocks
+        = (N_next + offspring_block_size - 1) / offspring_block_size;
+    if (ancestry.shards.size() < nblocks)
+        {
+            ancestry.shards.resize(nblocks);
+        }
+    for (std::size_t b = 0; b < nblocks; ++b)
+        {
+            ancestry.shards[b].seed = gsl_rng_get(rng.get());
+        }
+    const auto first_child = ancestry.next_index;
+    for (KTfwd::uint_t i = 0; i < N_next; ++i)
+        {
+            ancestry.get_next_indexes();
+        }
+
+    // Parallel part: nothing shared is written to here.
+    auto make_block = [&](const fwdpy11::GSLrng_t& block_rng,
+                          const std::size_t b) {
+        auto& shard = ancestry.shards[b];
+        auto& breakpoints = shard.meiosis_breakpoints;
+        gsl_rng_set(block_rng.get(), shard.seed);
+        auto add_meiosis = [&](const std::size_t parent, const int swap,
+                               const ancestry_tracker::integer_type child) {
+            recmodel(block_rng.get(), breakpoints);
+            // Remove double x-overs, as in
+            // ancestry_recombination_details
+            const auto double_crossovers
+                = ancestry_tracker::remove_double_crossovers(breakpoints);
+            ancestry.record_meiosis(breakpoints,
+                                    ancestry.get_parent_ids(parent, swap),
+                                    child, shard, double_crossovers);
+            shard.breakpoints.insert(shard.breakpoints.end(),
+                                     breakpoints.begin(), breakpoints.end());
+            shard.nbreakpoints.push_back(breakpoints.size());
+        };
+        const auto end
+            = std::min<std::size_t>((b + 1) * offspring_block_size, N_next);
+        for (auto i = b * offspring_block_size; i < end; ++i)
+            {
+                offspring_parents op;
+                op.p1 = pick1(block_rng, pop);
+                op.p2 = pick2(block_rng, pop, op.p1);
+                // Mendel
+                op.swap1 = (gsl_rng_uniform(block_rng.get()) < 0.5) ? 1 : 0;
+                op.swap2 = (gsl_rng_uniform(block_rng.get()) < 0.5) ? 1 : 0;
+                shard.parents.push_back(op);
+                const auto child = first_child
+                                   + 2 * static_cast<
+                                             ancestry_tracker::integer_type>(i);
+                add_meiosis(op.p1, op.swap1, child);
+                add_meiosis(op.p2, op.swap2, child + 1);
+            }
+    };
+    std::atomic<std::size_t> next_block{ 0 };
+    auto worker = [&](const fwdpy11::GSLrng_t& block_rng) {
+        for (auto b = next_block++; b < nblocks; b = next_block++)
+            {
+                make_block(block_rng, b);
+            }
+    };
+    // threads keeps its capacity from one generation to the next.
+    threads.clear();
+    for (std::size_t t = 1; t < std::min(thread_rngs.size(), nblocks); ++t)
+        {
+            threads.emplace_back(worker, std::cref(thread_rngs[t]));
+        }
+    worker(thread_rngs.front());
+    for (auto& t : threads)
+        {
+            t.join();
+        }
+    threads.clear();
+
+    // Serial part: make the gametes and mutations.
+    auto gamete_recycling_bin
+        = KTfwd::fwdpp_internal::make_gamete_queue(pop.gametes);
+    auto mutation_recycling_bin
+        = KTfwd::fwdpp_internal::make_mut_queue(pop.mcounts);
+    for (auto&& g : pop.gametes)
+        g.n = 0;
+    offspring.resize(N_next);
+    auto& breakpoints = ancestry.breakpoints;
+    std::size_t label = 0;
+    for (std::size_t b = 0; b < nblocks; ++b)
+        {
+            const auto& shard = ancestry.shards[b];
+            auto bp = shard.breakpoints.begin();
+            auto nbp = shard.nbreakpoints.begin();
+            auto make_gamete = [&](const std::size_t parent, const int swap) {
+                auto g1 = pop.diploids[parent].first;
+                auto g2 = pop.diploids[parent].second;
+                if (swap)
+                    std::swap(g1, g2);
+                breakpoints.assign(bp, bp + *nbp);
+                bp += *nbp++;
+                if (breakpoints.empty())
+                    return g1;
+                return KTfwd::recombine_gametes(
+                    breakpoints, pop.gametes, pop.mutations, g1, g2,
+                    gamete_recycling_bin, pop.neutral, pop.selected);
+            };
+            for (auto&& op : shard.parents)
+                {
+                    auto& dip = offspring[label];
+                    dip.first = make_gamete(op.p1, op.swap1);
+                    dip.second = make_gamete(op.p2, op.swap2);
+
+                    pop.gametes[dip.first].n++;
+                    pop.gametes[dip.second].n++;
+
+                    // now, add new mutations
+                    dip.first = KTfwd::mutate_gamete_recycle(
+                        mutation_recycling_bin, gamete_recycling_bin,
+                        rng.get(), mu, pop.gametes, pop.mutations, dip.first,
+                        mmodel, KTfwd::emplace_back());
+                    dip.second = KTfwd::mutate_gamete_recycle(
+                        mutation_recycling_bin, gamete_recycling_bin,
+                        rng.get(), mu, pop.gametes, pop.mutations, dip.second,
+                        mmodel, KTfwd::emplace_back());
+
+                    assert(pop.gametes[dip.first].n);
+                    assert(pop.gametes[dip.second].n);
+                    dip.label = label++;
+                    update(rng, dip, pop, op.p1, op.p2);
+                }
+        }
+    // This merges the shards into the tracker:
+    ancestry.finish_generation();
+    KTfwd::fwdpp_internal::process_gametes(pop.gametes, pop.mutations,
+                                           pop.mcounts);
+    KTfwd::fwdpp_internal::gamete_cleaner(pop.gametes, pop.mutations,
+                                          pop.mcounts, 2 * N_next, mrp);
+    // This is constant-time
+    pop.diploids.swap(offspring);
+}
+
 #endif
@@ -0,0 +1,125 @@
+#ifndef FWDPY11_ARG_EXAMPLE_EVOLVE_NEUTRAL_HPP__
+#define FWDPY11_ARG_EXAMPLE_EVOLVE_NEUTRAL_HPP__
+
+#include <algorithm>
+#include <cstddef>
+#include <tuple>
+#include <gsl/gsl_rng.h>
+#include <fwdpy11/types.hpp>
+#include <fwdpy11/rng.hpp>
+#include "ancestry_tracker.hpp"
+#include "breakpoints.hpp"
+#include "draws.hpp"
+
+// Without selected mutations, gametes never carry anything,
+// and all diploids have the same fitness.  A generation is
+// then only a matter of picking parents and recording the
+// ancestry, so fwdpp's gamete and mutation containers are
+// not touched at all.  N_curr is the number of parents.
+inline void
+evolve_generation_neutral(const fwdpy11::GSLrng_t& rng,
+                          const KTfwd::uint_t N_curr,
+                          const KTfwd::uint_t N_next,
+                          const double selfing_rate,
+                          const breakpoint_generator& recmodel,
+                          ancestry_tracker& ancestry)
+{
+    auto& breakpoints = ancestry.breakpoints;
+    auto add_meiosis = [&](const std::size_t parent, const int swap,
+                           const ancestry_tracker::integer_type child) {
+        recmodel(rng.get(), breakpoints);
+        // Remove double x-overs, as in
+        // ancestry_recombination_details
+        const auto double_crossovers
+            = ancestry_tracker::remove_double_crossovers(breakpoints);
+        ancestry.record_meiosis(breakpoints,
+                                ancestry.get_parent_ids(parent, swap), child,
+                                double_crossovers);
+    };
+    for (KTfwd::uint_t i = 0; i < N_next; ++i)
+        {
+            const std::size_t p1 = gsl_rng_uniform_int(rng.get(), N_curr);
+            const std::size_t p2
+                = (selfing_rate == 1.
+                   || (selfing_rate > 0.
+                       && gsl_rng_uniform(rng.get()) < selfing_rate))
+                      ? p1
+                      : gsl_rng_uniform_int(rng.get(), N_curr);
+            // Mendel
+            const int swap1 = (gsl_rng_uniform(rng.get()) < 0.5) ? 1 : 0;
+            const int swap2 = (gsl_rng_uniform(rng.get()) < 0.5) ? 1 : 0;
+            const auto offspring_indexes = ancestry.get_next_indexes();
+            add_meiosis(p1, swap1, std::get<0>(offspring_indexes));
+            add_meiosis(p2, swap2, std::get<1>(offspring_indexes));
+        }
+    ancestry.finish_generation();
+}
+
+inline void
+evolve_generation_neutral(const fwdpy11::GSLrng_t& rng,
+                          const KTfwd::uint_t N_curr,
+                          const KTfwd::uint_t N_next,
+                          const double selfing_rate,
+                          const breakpoint_generator& recmodel,
+                          ancestry_tracker& ancestry, generation_draws& draws)
+/// As above, but all parents, Mendel swaps, and numbers
+/// of breakpoints are drawn before any offspring are made.
+{
+    draws.draw(
+        rng, N_next,
+        [N_curr](const fwdpy11::GSLrng_t& r) -> std::size_t {
+            return gsl_rng_uniform_int(r.get(), N_curr);
+        },
+        [N_curr, selfing_rate](const fwdpy11::GSLrng_t& r,
+                               const std::size_t p1) -> std::size_t {
+            return (selfing_rate == 1.
+                    || (selfing_rate > 0.
+                        && gsl_rng_uniform(r.get()) < selfing_rate))
+                       ? p1
+                       : gsl_rng_uniform_int(r.get(), N_curr);
+        },
+        recmodel);
+    auto& breakpoints = ancestry.breakpoints;
+    auto add_meiosis = [&](const std::size_t i,
+                           const ancestry_tracker::integer_type child) {
+        recmodel.positions(rng.get(), draws.nbreakpoints[i], breakpoints);
+        const auto double_crossovers
+            = ancestry_tracker::remove_double_crossovers(breakpoints);
+        ancestry.record_meiosis(
+            breakpoints,
+            ancestry.get_parent_ids(draws.parents[i], draws.swaps[i]), child,
+            double_crossovers);
+    };
+    for (std::size_t i = 0; i < draws.parents.size(); i += 2)
+        {
+            const auto offspring_indexes = ancestry.get_next_indexes();
+            add_meiosis(i, std::get<0>(offspring_indexes));
+            add_meiosis(i + 1, std::get<1>(offspring_indexes));
+        }
+    ancestry.finish_generation();
+}
+
+template <typename poptype>
+void
+finish_neutral_population(poptype& pop)
+/// Make pop.diploids match pop.N once a neutral
+/// simulation is done.  No gamete carries a mutation,
+/// so every diploid has two copies of the first gamete.
+{
+    pop.diploids.resize(pop.N);
+    std::size_t label = 0;
+    for (auto& dip : pop.diploids)
+        {
+            dip.first = dip.second = 0;
+            dip.g = dip.e = 0.;
+            dip.w = 1.;
+            dip.label = label++;
+        }
+    for (auto& g : pop.gametes)
+        {
+            g.n = 0;
+        }
+    pop.gametes[0].n = 2 * pop.N;
+}
+
+#endif
@@ -0,0 +1,43 @@
+// This file defines when garbage collection
+// (simplification) happens during a simulation.
+// The policy is checked in C++ every generation,
+// so that Python is only called when we actually
+// simplify.  It is exposed to Python as wfarg.GCPolicy.
+
+#ifndef ANCESTRY_GC_POLICY_HPP__
+#define ANCESTRY_GC_POLICY_HPP__
+
+#include <cstddef>
+#include <stdexcept>
+#include "ancestry_tracker.hpp"
+
+struct gc_policy
+{
+    /// Simplify when this many generations
+    /// have passed since the last GC:
+    unsigned interval;
+    /// If nonzero, also simplify when there are
+    /// at least this many unsimplified edges:
+    std::size_t max_edges;
+    gc_policy(const unsigned gc_interval, const std::size_t gc_max_edges = 0)
+        : interval{ gc_interval }, max_edges{ gc_max_edges }
+    {
+        if (!interval)
+            {
+                throw std::invalid_argument("GC interval must be > 0");
+            }
+    }
+
+    bool
+    operator()(const unsigned generation, const ancestry_tracker& ancestry) const
+    /// Returns true if we should simplify at the start of generation.
+    {
+        if (generation == 0)
+            return false;
+        if (generation - ancestry.last_gc_time >= interval)
+            return true;
+        return max_edges > 0 && ancestry.pending_edges() >= max_edges;
+    }
+};
+
+#endif
@@ -0,0 +1,45 @@
+// This file defines the counters that an ancestry_tracker
+// can record for each generation.  They are kept in a ring
+// buffer of fixed size, which is exposed to Python as a
+// NumPy structured array, without a copy.
+
+#ifndef ANCESTRY_GENERATION_STATS_HPP__
+#define ANCESTRY_GENERATION_STATS_HPP__
+
+#include <cstdint>
+
+struct generation_stats
+{
+    /// The generation of the offspring:
+    std::int32_t generation;
+    /// Nodes added:
+    std::uint32_t nodes;
+    /// Edges made.  Deferred meioses count
+    /// as the most edges that they can make:
+    std::uint64_t edges;
+    /// Breakpoints drawn, and the number of them
+    /// removed as double crossovers:
+    std::uint64_t breakpoints, double_crossovers;
+    /// The tracker's buffer_reallocations so far:
+    std::uint64_t buffer_reallocations;
+    /// Wall time spent in finish_generation, which merges
+    /// the shards and sorts and prunes the generation.  Time
+    /// spent adding each edge while making offspring
+    /// is not included, so this is not all of the
+    /// tracker's time:
+    double finish_seconds;
+};
+
+inline generation_stats
+make_generation_stats()
+{
+    generation_stats s;
+    s.generation = 0;
+    s.nodes = 0;
+    s.edges = s.breakpoints = s.double_crossovers = 0;
+    s.buffer_reallocations = 0;
+    s.finish_seconds = 0.;
+    return s;
+}
+
+#endif
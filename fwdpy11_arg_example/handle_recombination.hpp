@@ -6,11 +6,6 @@
 #include <fwdpy11/types.hpp>
 #include "ancestry_tracker.hpp"
 
-std::pair<std::vector<std::pair<double, double>>,
-          std::vector<std::pair<double, double>>>
-split_breakpoints(const std::vector<double>& breakpoints,
-                  const double start = 0., const double stop = 1.);
-
 // breakpoints is passed in non-const.  We filter out
 // double x-overs in this function. Really bad things will
 // happen if breakpoints is not up to fwdpp's spec!
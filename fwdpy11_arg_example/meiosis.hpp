@@ -0,0 +1,30 @@
+#ifndef ANCESTRY_MEIOSIS_HPP__
+#define ANCESTRY_MEIOSIS_HPP__
+
+#include <cstdint>
+#include "node_id.hpp"
+
+// A compact record of one meiosis, which is turned into
+// edges later on.  The breakpoints are stored in a shared
+// pool, in the same order as the meioses, so the offset of
+// a meiosis' breakpoints is the sum of nbreakpoints over
+// the meioses before it.
+struct meiosis
+{
+    node_id_t parent1, parent2, child;
+    std::uint32_t nbreakpoints;
+};
+
+inline meiosis
+make_meiosis(node_id_t parent1, node_id_t parent2, node_id_t child,
+             std::uint32_t nbreakpoints)
+{
+    meiosis m;
+    m.parent1 = parent1;
+    m.parent2 = parent2;
+    m.child = child;
+    m.nbreakpoints = nbreakpoints;
+    return m;
+}
+
+#endif
@@ -3,16 +3,18 @@
 
 #include <cstdint>
 #include <tuple>
+#include <type_traits>
+#include "node_id.hpp"
 
 struct node
 {
-    std::uint32_t id;
+    std::make_unsigned<node_id_t>::type id;
 	std::int32_t population;
 	double generation;
 };
 
 inline node
-make_node(std::uint32_t id, double generation, std::int32_t population)
+make_node(std::make_unsigned<node_id_t>::type id, double generation, std::int32_t population)
 {
     node n;
     n.id = id;
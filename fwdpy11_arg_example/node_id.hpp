@@ -0,0 +1,20 @@
+// This file defines the integer type of node IDs.  They
+// are 32-bit by default, which is what msprime uses.  If
+// ANCESTRY_64BIT_IDS is defined when building (see the
+// --64bit-ids option of setup.py), they are 64-bit, so
+// that many more nodes can be recorded between GCs.  IDs
+// are narrowed to 32 bits when they are handed to msprime,
+// which must be after simplification if there are too many.
+
+#ifndef ANCESTRY_NODE_ID_HPP__
+#define ANCESTRY_NODE_ID_HPP__
+
+#include <cstdint>
+
+#ifdef ANCESTRY_64BIT_IDS
+using node_id_t = std::int64_t;
+#else
+using node_id_t = std::int32_t;
+#endif
+
+#endif
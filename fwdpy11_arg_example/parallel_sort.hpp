@@ -0,0 +1,84 @@
+// A simple multi-threaded sort.  The range
+// is split into one chunk per thread, each chunk
+// is sorted by std::sort, and the sorted chunks
+// are then merged pairwise, also in parallel.
+//
+// Small ranges are not worth the cost of starting
+// threads, so the number of threads is reduced until
+// each one has at least min_chunk_size elements to work on.
+
+#ifndef ANCESTRY_PARALLEL_SORT_HPP__
+#define ANCESTRY_PARALLEL_SORT_HPP__
+
+#include <algorithm>
+#include <cstddef>
+#include <iterator>
+#include <thread>
+#include <vector>
+
+template <typename iterator, typename comparison>
+void
+parallel_sort(iterator beg, iterator end, const comparison& comp,
+              unsigned nthreads, const std::size_t min_chunk_size = 1 << 16)
+{
+    const std::size_t n = std::distance(beg, end);
+    if (nthreads == 0)
+        {
+            nthreads = std::max(1u, std::thread::hardware_concurrency());
+        }
+    while (nthreads > 1 && n / nthreads < min_chunk_size)
+        {
+            --nthreads;
+        }
+    if (nthreads < 2)
+        {
+            std::sort(beg, end, comp);
+            return;
+        }
+
+    // Chunk boundaries:
+    std::vector<iterator> bounds;
+    for (unsigned i = 0; i < nthreads; ++i)
+        {
+            bounds.push_back(beg + i * (n / nthreads));
+        }
+    bounds.push_back(end);
+
+    std::vector<std::thread> threads;
+    for (unsigned i = 0; i < nthreads; ++i)
+        {
+            threads.emplace_back([&comp](iterator b, iterator e) {
+                std::sort(b, e, comp);
+            }, bounds[i], bounds[i + 1]);
+        }
+    for (auto& t : threads)
+        t.join();
+
+    // Merge neighboring chunks until only one remains
+    while (bounds.size() > 2)
+        {
+            threads.clear();
+            std::vector<iterator> merged_bounds;
+            std::size_t i = 0;
+            for (; i + 2 < bounds.size(); i += 2)
+                {
+                    threads.emplace_back(
+                        [&comp](iterator b, iterator m, iterator e) {
+                            std::inplace_merge(b, m, e, comp);
+                        },
+                        bounds[i], bounds[i + 1], bounds[i + 2]);
+                    merged_bounds.push_back(bounds[i]);
+                }
+            // An odd chunk out is carried over to the next round
+            if (i + 1 < bounds.size())
+                {
+                    merged_bounds.push_back(bounds[i]);
+                }
+            merged_bounds.push_back(end);
+            for (auto& t : threads)
+                t.join();
+            bounds.swap(merged_bounds);
+        }
+}
+
+#endif
@@ -0,0 +1,73 @@
+// This file defines the data that one thread makes
+// for a block of offspring when generations are made
+// in parallel.  Each block has its own shard, and the
+// shards are merged into the ancestry_tracker, in
+// block order, by finish_generation.  This makes the
+// result independent of the number of threads.
+
+#ifndef ANCESTRY_SHARD_HPP__
+#define ANCESTRY_SHARD_HPP__
+
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+
+#include "edge.hpp"
+#include "compact.hpp"
+#include "meiosis.hpp"
+#include "generation_stats.hpp"
+
+struct offspring_parents
+{
+    std::size_t p1, p2;
+    int swap1, swap2;
+};
+
+struct ancestry_shard
+{
+    /// Seed for this block's random numbers:
+    unsigned long seed;
+    /// Edges, or meioses and their breakpoints,
+    /// in the same form as ancestry_tracker's:
+    std::vector<edge> edges;
+    std::vector<compact_edge> compact_edges;
+    std::vector<meiosis> meioses;
+    std::vector<double> breakpoint_pool;
+    /// The parents of each offspring, and the breakpoints
+    /// of each meiosis, in fwdpp's format, which are needed
+    /// to make the offspring's gametes afterwards:
+    std::vector<offspring_parents> parents;
+    std::vector<double> breakpoints;
+    std::vector<std::size_t> nbreakpoints;
+    /// Scratch space for the breakpoints of one meiosis:
+    std::vector<double> meiosis_breakpoints;
+    /// Number of edges saved by add_edges:
+    std::size_t coalesced_edges;
+    /// Breakpoint counts, if the tracker records stats:
+    generation_stats stats;
+
+    ancestry_shard()
+        : seed{ 0 }, edges{}, compact_edges{}, meioses{}, breakpoint_pool{},
+          parents{}, breakpoints{}, nbreakpoints{}, meiosis_breakpoints{},
+          coalesced_edges{ 0 },
+          stats(make_generation_stats())
+    {
+    }
+
+    void
+    clear()
+    /// Memory is kept for the next generation.
+    {
+        edges.clear();
+        compact_edges.clear();
+        meioses.clear();
+        breakpoint_pool.clear();
+        parents.clear();
+        breakpoints.clear();
+        nbreakpoints.clear();
+        coalesced_edges = 0;
+        stats = make_generation_stats();
+    }
+};
+
+#endif
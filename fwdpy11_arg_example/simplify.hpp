@@ -0,0 +1,313 @@
+// This file implements the simplification algorithm
+// used by msprime, operating directly on the vectors
+// of nodes and edges stored in an ancestry_tracker.
+// Doing this in C++ means that no data need to be
+// copied into msprime's tables during a simulation.
+//
+// The algorithm works backwards in time, one parent at a time.
+// Each node has a list of segments, which record which
+// output node carries the ancestry of the samples on a
+// genomic interval.  A parent collects the segments of its
+// children that overlap its edges.  Where two or more overlap,
+// there is a coalescence, and the parent becomes a node
+// in the output.  Elsewhere, the ancestry is passed up
+// through the parent unchanged.
+//
+// Genomic positions are assumed to be on [0,1).
+
+#ifndef ANCESTRY_SIMPLIFY_HPP__
+#define ANCESTRY_SIMPLIFY_HPP__
+
+#include <algorithm>
+#include <cstddef>
+#include <limits>
+#include <stdexcept>
+#include <string>
+#include <tuple>
+#include <vector>
+
+#include "node.hpp"
+#include "edge.hpp"
+
+template <typename integer_type> struct ancestry_segment
+{
+    double left, right;
+    integer_type node;
+};
+
+template <typename integer_type>
+inline void
+add_squashed_edges(std::vector<edge>& edge_buffer, std::vector<edge>& output)
+// Edges to the same child with abutting intervals
+// are merged before being added to output.
+{
+    std::sort(edge_buffer.begin(), edge_buffer.end(),
+              [](const edge& a, const edge& b) {
+                  return std::tie(a.child, a.left) < std::tie(b.child, b.left);
+              });
+    for (auto&& e : edge_buffer)
+        {
+            if (!output.empty() && output.back().parent == e.parent
+                && output.back().child == e.child
+                && output.back().right == e.left)
+                {
+                    output.back().right = e.right;
+                }
+            else
+                {
+                    output.push_back(e);
+                }
+        }
+    edge_buffer.clear();
+}
+
+template <typename integer_type> struct ancestry_simplifier
+/// The state of the simplification algorithm.  Keeping an
+/// instance between calls means that its segment index and
+/// output buffers are only allocated once, rather than for
+/// every call.  Each node's ancestry is a linked list of
+/// segments in one pool, rather than a vector per node.
+///
+/// This is not an incremental simplifier: every call walks
+/// all of the edges, including those that were output by the
+/// last call.  The previous samples are not samples of the
+/// next call, so lineages in the retained history may be
+/// removed and all node IDs change.  The work per call therefore
+/// grows with the size of the retained history.
+{
+    using segment = ancestry_segment<integer_type>;
+    /// All segments, and the index of the
+    /// next segment of the same node, if any:
+    std::vector<segment> pool;
+    std::vector<std::size_t> next;
+    /// The first and last segments of each input node:
+    std::vector<std::size_t> head, tail;
+    /// Maps input node IDs to output node IDs:
+    std::vector<integer_type> idmap;
+    std::vector<node> new_nodes;
+    std::vector<edge> new_edges, edge_buffer;
+    std::vector<segment> overlaps, active;
+
+    static std::size_t
+    null()
+    {
+        return std::numeric_limits<std::size_t>::max();
+    }
+
+    void
+    add_segment(const integer_type input_node, const double left,
+                const double right, const integer_type output_node)
+    // Merge abutting segments mapping to the same output node
+    {
+        const auto last = tail[input_node];
+        if (last != null() && pool[last].node == output_node
+            && pool[last].right == left)
+            {
+                pool[last].right = right;
+                return;
+            }
+        pool.push_back(segment{ left, right, output_node });
+        next.push_back(null());
+        if (last == null())
+            {
+                head[input_node] = pool.size() - 1;
+            }
+        else
+            {
+                next[last] = pool.size() - 1;
+            }
+        tail[input_node] = pool.size() - 1;
+    }
+
+    integer_type
+    add_output_node(const node& n)
+    {
+        const auto id = static_cast<integer_type>(new_nodes.size());
+        new_nodes.emplace_back(make_node(id, n.generation, n.population));
+        return id;
+    }
+
+    void
+    process_parent(const std::vector<node>& nodes,
+                   const std::vector<edge>& edges, const std::size_t beg,
+                   const std::size_t end)
+    /// Process the edges [beg, end), which all have the same parent.
+    {
+        const auto parent = edges[beg].parent;
+        overlaps.clear();
+        for (auto i = beg; i < end; ++i)
+            {
+                const auto& e = edges[i];
+                for (auto k = head[e.child]; k != null(); k = next[k])
+                    {
+                        const auto& seg = pool[k];
+                        if (seg.right > e.left && e.right > seg.left)
+                            {
+                                overlaps.push_back(
+                                    segment{ std::max(seg.left, e.left),
+                                             std::min(seg.right, e.right),
+                                             seg.node });
+                            }
+                    }
+            }
+        if (overlaps.empty())
+            return;
+
+        auto output_id = idmap[parent];
+        if (output_id != -1)
+            {
+                // The parent is a sample, and all of the
+                // ancestry that it receives ends with it.
+                for (auto&& seg : overlaps)
+                    {
+                        edge_buffer.emplace_back(make_edge(
+                            seg.left, seg.right, output_id, seg.node));
+                    }
+                add_squashed_edges<integer_type>(edge_buffer, new_edges);
+                return;
+            }
+
+        std::sort(overlaps.begin(), overlaps.end(),
+                  [](const segment& a, const segment& b) {
+                      return a.left < b.left;
+                  });
+        std::size_t i = 0;
+        double left = 0.;
+        active.clear();
+        while (i < overlaps.size() || !active.empty())
+            {
+                if (active.empty())
+                    {
+                        left = overlaps[i].left;
+                    }
+                while (i < overlaps.size() && overlaps[i].left == left)
+                    {
+                        active.push_back(overlaps[i++]);
+                    }
+                double right = std::numeric_limits<double>::max();
+                for (auto&& seg : active)
+                    {
+                        right = std::min(right, seg.right);
+                    }
+                if (i < overlaps.size())
+                    {
+                        right = std::min(right, overlaps[i].left);
+                    }
+                if (active.size() == 1)
+                    {
+                        add_segment(parent, left, right, active.front().node);
+                    }
+                else
+                    {
+                        if (output_id == -1)
+                            {
+                                output_id = add_output_node(nodes[parent]);
+                                idmap[parent] = output_id;
+                            }
+                        for (auto&& seg : active)
+                            {
+                                edge_buffer.emplace_back(make_edge(
+                                    left, right, output_id, seg.node));
+                            }
+                        add_segment(parent, left, right, output_id);
+                    }
+                active.erase(std::remove_if(active.begin(), active.end(),
+                                            [right](const segment& seg) {
+                                                return seg.right == right;
+                                            }),
+                             active.end());
+                for (auto& seg : active)
+                    {
+                        seg.left = right;
+                    }
+                left = right;
+            }
+        add_squashed_edges<integer_type>(edge_buffer, new_edges);
+    }
+
+    void
+    process_range(const std::vector<node>& nodes,
+                  const std::vector<edge>& edges, const std::size_t beg,
+                  const std::size_t end)
+    /// Process the edges one parent at a time
+    {
+        auto i = beg;
+        while (i < end)
+            {
+                auto j = i + 1;
+                while (j < end && edges[j].parent == edges[i].parent)
+                    {
+                        ++j;
+                    }
+                process_parent(nodes, edges, i, j);
+                i = j;
+            }
+    }
+
+    const std::vector<integer_type>&
+    operator()(std::vector<node>& nodes, std::vector<edge>& edges,
+               const std::size_t first_new_edge,
+               const std::vector<integer_type>& samples)
+    /// Simplify nodes and edges with respect to samples.
+    ///
+    /// Node IDs must be equal to their index in nodes.
+    /// The edges in the range [first_new_edge, edges.size())
+    /// and [0, first_new_edge) must each be sorted as
+    /// required by msprime, and all parents in the first range
+    /// must be younger than all parents in the second.
+    ///
+    /// On return, nodes and edges contain the simplified
+    /// data.  The samples are nodes 0 through samples.size() - 1.
+    /// The return value maps input node IDs to output node IDs,
+    /// with -1 denoting a node that was removed.  It is valid
+    /// until the next call.
+    {
+        // Clearing keeps the memory from the last call.
+        pool.clear();
+        next.clear();
+        head.assign(nodes.size(), null());
+        tail.assign(nodes.size(), null());
+        idmap.assign(nodes.size(), -1);
+        new_nodes.clear();
+        new_edges.clear();
+
+        for (auto&& s : samples)
+            {
+                if (s < 0 || static_cast<std::size_t>(s) >= nodes.size())
+                    {
+                        throw std::runtime_error("sample " + std::to_string(s)
+                                                 + " is not a valid node");
+                    }
+                if (idmap[s] != -1)
+                    {
+                        throw std::runtime_error("duplicate sample "
+                                                 + std::to_string(s));
+                    }
+                idmap[s] = add_output_node(nodes[s]);
+                add_segment(s, 0., 1., idmap[s]);
+            }
+
+        process_range(nodes, edges, first_new_edge, edges.size());
+        process_range(nodes, edges, 0, first_new_edge);
+
+        // Copying, rather than swapping, keeps the
+        // memory already allocated for nodes and edges.
+        nodes.assign(new_nodes.begin(), new_nodes.end());
+        edges.assign(new_edges.begin(), new_edges.end());
+        return idmap;
+    }
+};
+
+template <typename integer_type>
+std::vector<integer_type>
+simplify_nodes_edges(std::vector<node>& nodes, std::vector<edge>& edges,
+                     const std::size_t first_new_edge,
+                     const std::vector<integer_type>& samples)
+/// Simplify once, without keeping the state.
+/// See ancestry_simplifier.
+{
+    ancestry_simplifier<integer_type> simplifier;
+    return simplifier(nodes, edges, first_new_edge, samples);
+}
+
+#endif
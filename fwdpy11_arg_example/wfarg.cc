@@ -1,4 +1,6 @@
 #include <chrono>
+#include <functional>
+#include <thread>
 #include <pybind11/chrono.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl_bind.h>
@@ -13,31 +15,41 @@
 #include <fwdpp/sugar/singlepop.hpp>
 #include <fwdpp/sugar/GSLrng_t.hpp>
 #include "ancestry_tracker.hpp"
+#include "gc_policy.hpp"
+#include "breakpoints.hpp"
 #include "evolve_generation.hpp"
+#include "evolve_neutral.hpp"
 
 namespace py = pybind11;
 
 // This function runs the simulation itself.
 // The details of a generation are in the file
-// evolve_generation.hpp. This function gets
+// evolve_generation.hpp, or evolve_neutral.hpp if
+// there are no selected mutations. This function gets
 // exposed to Python, but it is not called
 // directly by a user. The function "evolve_track"
 // in evolve_arg.py takes the fwdpy11 objects and
 // passes them along to this function. The main purpose
 // of this function is to check parameters and send
 // data to msprime when needed.
-// The argument ancestry_processor is a Python callable.
-// It is to handle the GC/simplification step via msprime.
-// It should be an instance of ARGsimplifier.
+// The argument ancestry_processor is to handle the
+// GC/simplification step via msprime.  It should be an
+// instance of ARGsimplifier.  Its simplify function is
+// only called when gc says that it is time to simplify,
+// or if the next generation would overflow the node IDs.
+// It may change gc when it simplifies, which is how
+// adaptive GC schedules take effect.
 // The return value is the time spent simulating.
 double
 evolve_singlepop_regions_track_ancestry(
     const fwdpy11::GSLrng_t& rng, fwdpy11::singlepop_t& pop,
-    ancestry_tracker& ancestry, py::function ancestry_processor,
-    py::array_t<std::uint32_t> popsizes, const double mu_selected,
+    ancestry_tracker& ancestry, py::object ancestry_processor,
+    gc_policy& gc, py::array_t<std::uint32_t> popsizes, const double mu_selected,
     const double recrate, const KTfwd::extensions::discrete_mut_model& mmodel,
-    const KTfwd::extensions::discrete_rec_model& rmodel,
-    fwdpy11::single_locus_fitness& fitness, const double selfing_rate)
+    std::vector<double> rec_beg, std::vector<double> rec_end,
+    const std::vector<double>& rec_weight,
+    fwdpy11::single_locus_fitness& fitness, const double selfing_rate,
+    unsigned nthreads, const bool batch_draws)
 {
     if (pop.generation > 0)
         {
@@ -61,60 +73,196 @@ evolve_singlepop_regions_track_ancestry(
         std::ceil(std::log(2 * pop.N)
                   * (4. * double(pop.N) * (mu_selected)
                      + 0.667 * (4. * double(pop.N) * (mu_selected)))));
-    const auto recmap = KTfwd::extensions::bind_drm(
-        rmodel, pop.gametes, pop.mutations, rng.get(), recrate);
+    // Recombination breakpoints are generated into
+    // ancestry.breakpoints, rather than a new vector
+    // for each meiosis:
+    const breakpoint_generator breakpoints(
+        std::move(rec_beg), std::move(rec_end), rec_weight, recrate);
+    const auto recmap = std::bind(&breakpoint_generator::operator(),
+                                  &breakpoints, rng.get(),
+                                  std::placeholders::_1);
     const auto mmodels = KTfwd::extensions::bind_dmm(
         mmodel, pop.mutations, pop.mut_lookup, rng.get(), 0.0, mu_selected,
         &pop.generation);
     ++pop.generation;
     auto rules = fwdpy11::wf_rules();
 
+    const auto pick1 = std::bind(&fwdpy11::wf_rules::pick1, &rules,
+                                 std::placeholders::_1, std::placeholders::_2);
+    const auto pick2 = std::bind(&fwdpy11::wf_rules::pick2, &rules,
+                                 std::placeholders::_1, std::placeholders::_2,
+                                 std::placeholders::_3, selfing_rate);
+    const auto update = std::bind(
+        &fwdpy11::wf_rules::update, &rules, std::placeholders::_1,
+        std::placeholders::_2, std::placeholders::_3, std::placeholders::_4,
+        std::placeholders::_5);
+
+    // Without selected mutations, gametes never carry anything,
+    // and evolve_generation_neutral only tracks the ancestry.
+    const bool neutral = (mu_selected == 0.) && pop.mutations.empty();
+
+    // With more than one thread, offspring are made in parallel.
+    // Each thread has a random number generator, which is reseeded
+    // from rng for each block of offspring, so the seeds here are
+    // not used.
+    if (nthreads == 0)
+        {
+            nthreads = std::max(1u, std::thread::hardware_concurrency());
+        }
+    std::vector<fwdpy11::GSLrng_t> thread_rngs;
+    // The worker threads of each generation.  They are started
+    // anew each generation, but the vector keeps its memory.
+    std::vector<std::thread> threads;
+    if (nthreads > 1)
+        {
+            threads.reserve(nthreads);
+            for (unsigned i = 0; i < nthreads; ++i)
+                {
+                    thread_rngs.emplace_back(0);
+                }
+        }
+
     auto fitness_callback = fitness.callback();
     fitness.update(pop);
-    auto wbar = rules.w(pop, fitness_callback);
+    // rules.w fills in the fitnesses that pick1 and pick2
+    // use.  The mean fitness that it returns is not needed.
+    rules.w(pop, fitness_callback);
+
+    // Diploids are swapped between pop and offspring,
+    // so that neither needs to be allocated again.
+    decltype(pop.diploids) offspring;
+    offspring.reserve(pop.diploids.size());
+    // If batch_draws is true, each generation's parents,
+    // Mendel swaps, and numbers of breakpoints are drawn
+    // up front.  This is ignored when there are threads,
+    // as each block of offspring has its own random numbers.
+    generation_draws draws;
+
+    // The tracker's buffers are reserved for the generations
+    // up to the next GC, at the start and after each GC.
+    // Each meiosis makes one edge, plus one per crossover.
+    auto plan_capacity = [&](const unsigned generation) {
+        const auto first = popsizes.data() + generation;
+        ancestry.plan_capacity(
+            first, first + std::min<std::size_t>(gc.interval,
+                                                 generations - generation),
+            1.0 + recrate);
+    };
+    plan_capacity(0);
 
     double time_simulating = 0.0;
     for (unsigned generation = 0; generation < generations;
          ++generation, ++pop.generation)
         {
-			//Ask if we need to garbage collect:
-            py::tuple processor_rv
-                = ancestry_processor(pop.generation, ancestry);
-			//If we did GC, then the ancestry_tracker has
-			//some cleaning upto do:
-            ancestry.post_process_gc(processor_rv);
+            const auto N_next = popsizes.at(generation);
+            //Garbage collect if the policy says so.
+            //If the node IDs for the next generation
+            //would overflow, we must simplify now,
+            //even if we are in between GC intervals.
+            if (gc(pop.generation, ancestry)
+                || ancestry.next_generation_overflows(N_next))
+                {
+                    py::tuple processor_rv = ancestry_processor.attr(
+                        "simplify")(pop.generation, ancestry);
+                    //The ancestry_tracker has
+                    //some cleaning upto do:
+                    ancestry.post_process_gc(processor_rv);
+                    //A simplification in the background does not
+                    //change the IDs until it is waited for, which
+                    //we must do now if they would overflow.
+                    if (processor_rv[1].is_none()
+                        && ancestry.next_generation_overflows(N_next))
+                        {
+                            ancestry_processor.attr("wait")(ancestry);
+                        }
+                    if (ancestry.next_generation_overflows(N_next))
+                        {
+                            throw std::runtime_error(
+                                "node IDs overflow even after simplification "
+                                "in generation "
+                                + std::to_string(pop.generation));
+                        }
+                    plan_capacity(generation);
+                }
 
 			//This is not great API design, but 
 			//we need to clear the offspring indexes here:
             ancestry.offspring_indexes.clear();
-            const auto N_next = popsizes.at(generation);
+            //Making offspring does not need Python, so we
+            //let go of the GIL.  This lets the simplifier
+            //work in a background thread.  The fitness model
+            //may be written in Python, so it is only called
+            //with the GIL, below.
+            py::gil_scoped_release release;
             auto start = std::chrono::system_clock::now();
-            evolve_generation(
-                rng, pop, N_next, mu_selected, mmodels, recmap,
-                std::bind(&fwdpy11::wf_rules::pick1, &rules,
-                          std::placeholders::_1, std::placeholders::_2),
-                std::bind(&fwdpy11::wf_rules::pick2, &rules,
-                          std::placeholders::_1, std::placeholders::_2,
-                          std::placeholders::_3, selfing_rate),
-                std::bind(&fwdpy11::wf_rules::update, &rules,
-                          std::placeholders::_1, std::placeholders::_2,
-                          std::placeholders::_3, std::placeholders::_4,
-                          std::placeholders::_5),
-                ancestry, std::true_type());
+            if (neutral && batch_draws)
+                {
+                    evolve_generation_neutral(rng, pop.N, N_next,
+                                              selfing_rate, breakpoints,
+                                              ancestry, draws);
+                }
+            else if (neutral)
+                {
+                    evolve_generation_neutral(rng, pop.N, N_next,
+                                              selfing_rate, breakpoints,
+                                              ancestry);
+                }
+            else if (!thread_rngs.empty())
+                {
+                    evolve_generation_parallel(
+                        rng, thread_rngs, threads, pop, N_next, mu_selected,
+                        mmodels,
+                        breakpoints, pick1, pick2, update, ancestry,
+                        offspring, std::true_type());
+                }
+            else if (batch_draws)
+                {
+                    evolve_generation_batched(
+                        rng, pop, N_next, mu_selected, mmodels, breakpoints,
+                        pick1, pick2, update, ancestry, offspring, draws,
+                        std::true_type());
+                }
+            else
+                {
+                    evolve_generation(rng, pop, N_next, mu_selected, mmodels,
+                                      recmap, pick1, pick2, update, ancestry,
+                                      offspring, std::true_type());
+                }
             pop.N = N_next;
-            fwdpy11::update_mutations_wrapper()(
-                pop.mutations, pop.fixations, pop.fixation_times,
-                pop.mut_lookup, pop.mcounts, pop.generation, 2 * pop.N);
-            fitness.update(pop);
-            wbar = rules.w(pop, fitness_callback);
+            if (!neutral)
+                {
+                    fwdpy11::update_mutations_wrapper()(
+                        pop.mutations, pop.fixations, pop.fixation_times,
+                        pop.mut_lookup, pop.mcounts, pop.generation,
+                        2 * pop.N);
+                    py::gil_scoped_acquire acquire;
+                    fitness.update(pop);
+                    rules.w(pop, fitness_callback);
+                }
             auto stop = std::chrono::system_clock::now();
             auto dur = stop - start;
             time_simulating += std::chrono::duration<double>(dur).count();
         }
     --pop.generation;
+    if (neutral)
+        {
+            finish_neutral_population(pop);
+        }
     return time_simulating;
 }
 
+// Returns a getter for a NumPy array that views a column
+// without a copy.  The array keeps the column's owner alive.
+template <typename C, typename T>
+std::function<py::array_t<T>(py::object)>
+column_view(std::vector<T> C::*column)
+{
+    return [column](py::object self) {
+        auto& v = self.cast<C&>().*column;
+        return py::array_t<T>(v.size(), v.data(), self);
+    };
+}
+
 //Register vectors of nodes and edges as "opaque"
 PYBIND11_MAKE_OPAQUE(std::vector<node>);
 PYBIND11_MAKE_OPAQUE(std::vector<edge>);
@@ -128,6 +276,9 @@ PYBIND11_PLUGIN(wfarg)
     //Register nodes and edges as NumPy dtypes:
     PYBIND11_NUMPY_DTYPE(node, id, population, generation);
     PYBIND11_NUMPY_DTYPE(edge, left, right, parent, child);
+    PYBIND11_NUMPY_DTYPE(generation_stats, generation, nodes, edges,
+                         breakpoints, double_crossovers,
+                         buffer_reallocations, finish_seconds);
 
     //Create Python classes of node/edge containers.
     //These types support Python's buffer protocol, creating
@@ -143,20 +294,67 @@ PYBIND11_PLUGIN(wfarg)
                         "record array without making a copy",
         py::buffer_protocol());
 
+    //With 64-bit node IDs (see node_id.hpp), the
+    //name is kept, so that Python code need not change.
     py::bind_vector<std::vector<ancestry_tracker::integer_type>>(
-        m, "VecInt32", "Vector of 32-bit, signed integers.  Castable to Numpy "
+        m, "VecInt32", "Vector of signed node IDs, which are 32-bit unless "
+                       "built with 64-bit IDs.  Castable to Numpy "
                        "array without copy.",
         py::buffer_protocol());
+    m.attr("node_id_bits") = py::int_(8 * sizeof(node_id_t));
+
+    py::class_<node_columns>(m, "NodeColumns",
+                             "Columnar copy of nodes.  Each column is a "
+                             "contiguous NumPy array, made without a copy.")
+        .def_property_readonly("time", column_view(&node_columns::time))
+        .def_property_readonly("population",
+                               column_view(&node_columns::population))
+        .def_property_readonly("flags", column_view(&node_columns::flags));
+
+    py::class_<edge_columns>(m, "EdgeColumns",
+                             "Columnar copy of edges.  Each column is a "
+                             "contiguous NumPy array, made without a copy.")
+        .def_property_readonly("left", column_view(&edge_columns::left))
+        .def_property_readonly("right", column_view(&edge_columns::right))
+        .def_property_readonly("parent", column_view(&edge_columns::parent))
+        .def_property_readonly("child", column_view(&edge_columns::child))
+        .def_property_readonly(
+            "children_length", column_view(&edge_columns::children_length));
 
 	//Expose the C++ ancestry_tracker to Python.
 	//We only expose the stuff that a user really needs
 	//to see.
     py::class_<ancestry_tracker>(m, "AncestryTracker")
-        .def(py::init<KTfwd::uint_t>(), py::arg("N"))
+        .def(py::init<KTfwd::uint_t, bool, bool, bool>(), py::arg("N"),
+             py::arg("presort_edges") = false, py::arg("defer_edges") = false,
+             py::arg("compact") = false)
         .def_readwrite("nodes", &ancestry_tracker::nodes,
                        "Data for msprime.NodeTable.")
         .def_readwrite("edges", &ancestry_tracker::edges,
                        "Data for msprime.EdgesetTable.")
+        .def_readonly("compact", &ancestry_tracker::compact,
+                      "If True, nodes and edges are stored in a compact "
+                      "form, and nodes and edges are empty.  They are only "
+                      "decoded into node_table and edge_table by "
+                      "prep_for_gc.  Positions are rounded to about 2.3e-10.")
+        .def("num_nodes", &ancestry_tracker::num_nodes,
+             "The number of nodes stored, whether or not they are compact.")
+        .def_readonly("node_table", &ancestry_tracker::node_table,
+                      "Columnar copy of nodes, filled by prep_for_gc. This "
+                      "is a staging copy of nodes for msprime.")
+        .def_readonly("edge_table", &ancestry_tracker::edge_table,
+                      "Columnar copy of edges, filled by prep_for_gc. This "
+                      "is a staging copy of edges for msprime.")
+        .def_property_readonly(
+            "node_offsets", column_view(&ancestry_tracker::node_offsets),
+            "Where each generation's nodes start in nodes, as a NumPy "
+            "array viewing the data without a copy.  Entry i is for "
+            "generation offspring_generation - len(node_offsets) + i.")
+        .def_property_readonly(
+            "edge_offsets", column_view(&ancestry_tracker::edge_offsets),
+            "Where each generation's edges start in edges, as a NumPy "
+            "array viewing the data without a copy.  Entry i is for "
+            "generation offspring_generation - len(edge_offsets) + i.")
         .def_readwrite("samples", &ancestry_tracker::offspring_indexes,
                        "Sample indexes.")
         .def_readonly(
@@ -164,9 +362,143 @@ PYBIND11_PLUGIN(wfarg)
             "Read-only access to current offspring/children generation.")
         .def_readonly("last_gc_time", &ancestry_tracker::last_gc_time,
                       "Last time point where garbage collection happened.")
-        .def("prep_for_gc", &ancestry_tracker::prep_for_gc,
-             "Call this immediately before you are going to simplify.");
+        .def_readonly("presort_edges", &ancestry_tracker::presort_edges,
+                      "If True, edges are sorted one generation at a time "
+                      "and sort_edges takes linear time.")
+        .def_readwrite("prune_extinct", &ancestry_tracker::prune_extinct,
+                       "If True, nodes in the parental generation that leave "
+                       "no offspring are removed each generation, along with "
+                       "their edges.  Pruning does not cascade: older nodes "
+                       "whose children are all removed are kept until the "
+                       "next GC.")
+        .def_readonly("pruned_nodes", &ancestry_tracker::pruned_nodes,
+                      "Total number of nodes removed by pruning.")
+        .def_readonly("pruned_edges", &ancestry_tracker::pruned_edges,
+                      "Total number of edges removed by pruning.")
+        .def_readonly("defer_edges", &ancestry_tracker::defer_edges,
+                      "If True, each meiosis is recorded as its parents, "
+                      "child, and breakpoints.  These are turned into edges "
+                      "by sort_edges, skipping children with no descendants "
+                      "in the current generation.")
+        .def_readonly("skipped_edges", &ancestry_tracker::skipped_edges,
+                      "Total number of edges that were never made because "
+                      "their child had no descendants.")
+        .def_readonly("coalesced_edges", &ancestry_tracker::coalesced_edges,
+                      "Total number of edges that were not added because "
+                      "they abutted the previous edge of the same parent and "
+                      "child, which was extended instead.  This only "
+                      "happens with compact storage, when rounding makes "
+                      "two breakpoints equal.")
+        .def_readwrite("shrink_factor", &ancestry_tracker::shrink_factor,
+                       "If nonzero, a buffer whose capacity is more than "
+                       "shrink_factor times what is needed until the next GC "
+                       "has its memory released after the GC.  If 0, buffers "
+                       "keep their largest capacity.")
+        .def("enable_stats", &ancestry_tracker::enable_stats,
+             py::arg("generations"),
+             "Record counters for each generation, keeping those of the "
+             "last generations.  If generations is 0, nothing is recorded.")
+        .def_property_readonly(
+            "stats",
+            [](py::object self) {
+                auto& a = self.cast<ancestry_tracker&>();
+                return py::array_t<generation_stats>(
+                    std::min(a.stats_recorded, a.stats.size()),
+                    a.stats.data(), self);
+            },
+            "Counters recorded for recent generations, as a NumPy "
+            "structured array viewing the data without a copy.  This is "
+            "a ring buffer, so sort by generation to put it in order.  "
+            "Fields are generation, nodes, edges, breakpoints, "
+            "double_crossovers, buffer_reallocations so far, and "
+            "finish_seconds, the wall time spent in finish_generation.  "
+            "finish_seconds does not include the time spent recording "
+            "edges while offspring are made.")
+        .def_readonly("stats_recorded", &ancestry_tracker::stats_recorded,
+                      "Number of generations for which stats were recorded.")
+        .def("memory_used", &ancestry_tracker::memory_used,
+             "The number of bytes reserved for nodes, edges, "
+             "and their columns.")
+        .def("pending_edges", &ancestry_tracker::pending_edges,
+             "The number of edges waiting to be simplified, counting "
+             "the most that unmade edges could give.")
+        .def_readonly("buffer_reallocations",
+                      &ancestry_tracker::buffer_reallocations,
+                      "Number of times that one of the tracker's own buffers "
+                      "had to grow while a generation was made.  This stops "
+                      "increasing once the buffers are big enough.  It is not "
+                      "a count of all allocations: memory allocated elsewhere, "
+                      "such as by fwdpp or by threads, is not counted.")
+        .def("sort_edges",
+             [](ancestry_tracker& a, const unsigned nthreads) {
+                 py::gil_scoped_release release;
+                 a.sort_edges(nthreads);
+             },
+             py::arg("nthreads") = 0,
+             "Sort edges into msprime's required order. Large buffers are "
+             "sorted using nthreads threads.  If nthreads is 0, the number "
+             "of hardware threads is used. Call this before prep_for_gc.")
+        .def("simplify",
+             [](ancestry_tracker& a,
+                const std::vector<ancestry_tracker::integer_type>& samples)
+                 -> const std::vector<ancestry_tracker::integer_type>& {
+                 py::gil_scoped_release release;
+                 return a.simplify(samples);
+             },
+             py::arg("samples"), py::return_value_policy::reference_internal,
+             "Simplify the nodes and edges in place, without using msprime. "
+             "The current generation must be the first samples, in order. "
+             "Returns a VecInt32 mapping input node IDs to output node IDs. "
+             "Nodes that were removed map to -1.  The VecInt32 is a view "
+             "of the tracker's buffer, and is overwritten by the next call. "
+             "Every call processes all of the retained history, not just "
+             "the nodes and edges added since the last call.")
+        .def("detach_buffers", &ancestry_tracker::detach_buffers,
+             "Move the nodes, edges, and samples into a new AncestryTracker "
+             "that can be simplified while this one keeps recording. Node "
+             "IDs keep increasing until remap_ids is called.")
+        .def("remap_ids", &ancestry_tracker::remap_ids,
+             py::arg("first_sample"), py::arg("first_new_id"),
+             py::arg("num_simplified_nodes"),
+             "Give nodes recorded since detach_buffers their final IDs, "
+             "once the detached buffers have been simplified.")
+        .def_readwrite("next_index", &ancestry_tracker::next_index,
+                       "The ID of the next node to be added.  This should "
+                       "only be changed by tests.")
+        .def_readwrite("msprime_ids", &ancestry_tracker::msprime_ids,
+                       "If True, node IDs must fit in msprime's 32-bit "
+                       "IDs, so simplification happens early if they "
+                       "would not.  Set this to False when only "
+                       "simplify is used.")
+        .def("next_generation_overflows",
+             &ancestry_tracker::next_generation_overflows, py::arg("N"),
+             "True if the IDs of N more diploids would not fit.")
+        .def("prep_for_gc",
+             static_cast<void (ancestry_tracker::*)()>(
+                 &ancestry_tracker::prep_for_gc),
+             "Call this immediately before you are going to simplify.")
+        .def("prep_for_gc",
+             static_cast<void (ancestry_tracker::*)(const double)>(
+                 &ancestry_tracker::prep_for_gc),
+             py::arg("epoch"),
+             "Call this immediately before you are going to simplify. "
+             "Node times in node_table are epoch minus forward time.");
 	
+    py::class_<gc_policy>(m, "GCPolicy", "When to simplify during a "
+                                         "simulation.  This is checked in "
+                                         "C++ every generation.")
+        .def(py::init<unsigned, std::size_t>(), py::arg("interval"),
+             py::arg("max_edges") = 0)
+        .def_readwrite("interval", &gc_policy::interval,
+                       "Simplify when this many generations have passed "
+                       "since the last GC.")
+        .def_readwrite("max_edges", &gc_policy::max_edges,
+                       "If nonzero, also simplify when there are at least "
+                       "this many unsimplified edges.")
+        .def("__call__", &gc_policy::operator(), py::arg("generation"),
+             py::arg("ancestry"),
+             "Returns True if it is time to simplify.");
+
     //Make our C++ function callable from Python.
     //This is NOT part of a user-facing Python API.
     //Rather, we need a wrapper to integrate it with
@@ -36,6 +36,14 @@ if '--debug' in sys.argv:
 else:
     DEBUG_MODE = False
 
+# Node IDs are 32-bit by default.  64-bit IDs let
+# many more nodes be recorded between GCs.
+if '--64bit-ids' in sys.argv:
+    NODE_ID_64BIT = True
+    sys.argv.remove('--64bit-ids')
+else:
+    NODE_ID_64BIT = False
+
 
 class get_pybind_include(object):
     """Helper class to determine the pybind11 include path
@@ -129,6 +137,7 @@ class BuildExt(build_ext):
     def build_extensions(self):
         ct = self.compiler.compiler_type
         opts = self.c_opts.get(ct, [])
+        link_opts = []
         if ct == 'unix':
             opts.append('-DVERSION_INFO="%s"' %
                         self.distribution.get_version())
@@ -140,14 +149,23 @@ class BuildExt(build_ext):
                 opts.append('-g0')
             if DEBUG_MODE is True:
                 opts.append('-UNDEBUG')
+            if NODE_ID_64BIT is True:
+                opts.append('-DANCESTRY_64BIT_IDS')
+            # Edge sorting uses std::thread
+            if has_flag(self.compiler, '-pthread'):
+                opts.append('-pthread')
+                link_opts.append('-pthread')
         elif ct == 'msvc':
             opts.append('/DVERSION_INFO=\\"%s\\"' %
                         self.distribution.get_version())
+            if NODE_ID_64BIT is True:
+                opts.append('/DANCESTRY_64BIT_IDS')
         for ext in self.extensions:
             ext.extra_compile_args = opts
+            ext.extra_link_args = list(link_opts)
             if sys.platform == 'darwin' and USE_GCC is False:
-                ext.extra_link_args = ['-stdlib=libc++',
-                                       '-mmacosx-version-min=10.7']
+                ext.extra_link_args += ['-stdlib=libc++',
+                                        '-mmacosx-version-min=10.7']
         build_ext.build_extensions(self)
 
 
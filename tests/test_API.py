@@ -7,6 +7,399 @@ class tests_ArgSimplifier(unittest.TestCase):
         a = ArgSimplifier(10)
         self.assertEqual(callable(a),True)
 
+    def test_native(self):
+        from fwdpy11_arg_example.argsimplifier import ArgSimplifier
+        self.assertEqual(ArgSimplifier(10).native,False)
+        self.assertEqual(ArgSimplifier(10, native=True).native,True)
+
+    def test_background(self):
+        from fwdpy11_arg_example.argsimplifier import ArgSimplifier
+        self.assertEqual(ArgSimplifier(10).background,False)
+        self.assertEqual(ArgSimplifier(10, background=True).background,True)
+        with self.assertRaises(ValueError):
+            ArgSimplifier(10, native=True, background=True)
+
+    def test_background_time_ratio(self):
+        from fwdpy11_arg_example.argsimplifier import (ArgSimplifier,
+                                                       TimeRatio)
+        with self.assertRaises(ValueError):
+            ArgSimplifier(10, background=True, adaptive_gc=TimeRatio())
+
+    def test_adaptive_gc(self):
+        from fwdpy11_arg_example.argsimplifier import ArgSimplifier, EdgeBudget
+        with self.assertRaises(TypeError):
+            ArgSimplifier(10, adaptive_gc=100)
+        a = ArgSimplifier(10, adaptive_gc=EdgeBudget(100))
+        self.assertEqual(a.gc_records, [])
+
+    def test_adaptive_gc_abstract(self):
+        from fwdpy11_arg_example.argsimplifier import AdaptiveGC
+        with self.assertRaises(TypeError):
+            AdaptiveGC()
+
+    def test_edge_budget(self):
+        from fwdpy11_arg_example.argsimplifier import EdgeBudget
+        from fwdpy11_arg_example.wfarg import GCPolicy
+        policy = GCPolicy(10)
+        budget = EdgeBudget(1000, max_interval=50)
+        budget.start(policy)
+        self.assertEqual(policy.max_edges, 1000)
+        budget.update(policy, {'pending_edges': 500, 'generations': 10})
+        self.assertEqual(policy.interval, 20)
+        budget.update(policy, {'pending_edges': 10, 'generations': 10})
+        self.assertEqual(policy.interval, 50)
+
+    def test_memory_budget_exceeded(self):
+        import warnings
+        from fwdpy11_arg_example.argsimplifier import MemoryBudget
+        from fwdpy11_arg_example.wfarg import GCPolicy
+        policy = GCPolicy(10, 500)
+        budget = MemoryBudget(1000)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            budget.update(policy, {'pending_edges': 100, 'generations': 10,
+                                   'tracker_bytes': 4000,
+                                   'table_bytes': 2000})
+            self.assertEqual(len(w), 1)
+        self.assertEqual(policy.interval, 10)
+        self.assertEqual(policy.max_edges, 500)
+
+    def test_bytes_allocated(self):
+        from fwdpy11_arg_example.argsimplifier import ArgSimplifier
+        self.assertEqual(ArgSimplifier(10).bytes_allocated,[])
+
+
+class tests_AncestryTracker(unittest.TestCase):
+    def test_msprime_id_overflow(self):
+        from fwdpy11_arg_example.wfarg import AncestryTracker, node_id_bits
+        a = AncestryTracker(10)
+        self.assertEqual(a.msprime_ids, True)
+        a.next_index = 2**31 - 11
+        self.assertEqual(a.next_generation_overflows(5), False)
+        self.assertEqual(a.next_generation_overflows(6), True)
+        # Native simplification is only limited by the ID type
+        a.msprime_ids = False
+        self.assertEqual(a.next_generation_overflows(6), node_id_bits == 32)
+
+
+def evolve(seed=42, N=50, generations=200, gc_interval=10, mu=1e-2,
+           s=-0.025, **kwargs):
+    """
+    Evolve N diploids with selected mutations at rate mu,
+    so that every mode of evolve_track can be used.
+    With mu = 0, the neutral engine is used.
+    """
+    import numpy as np
+    import fwdpy11
+    import fwdpy11.fitness
+    import fwdpy11.model_params
+    from fwdpy11_arg_example.evolve_arg import evolve_track
+    pdict = {'rates': (0.0, mu, 100.0 / (4.0 * N)),
+             'nregions': [],
+             'sregions': [fwdpy11.ConstantS(0, 1, 1, s, 1.0)],
+             'recregions': [fwdpy11.Region(0, 1, 1)],
+             'gvalue': fwdpy11.fitness.SlocusMult(2.0),
+             'demography': np.array([N] * generations, dtype=np.uint32)}
+    params = fwdpy11.model_params.SlocusParams(**pdict)
+    return evolve_track(fwdpy11.GSLrng(seed), fwdpy11.SlocusPop(N), params,
+                        gc_interval, **kwargs)
+
+
+def tmrcas(simplifier, nsamples=10, npositions=20):
+    """
+    The times of the MRCAs of pairs of the first nsamples
+    samples, at random positions.  These do not depend on
+    the order of the nodes and edges.
+    """
+    return table_tmrcas(simplifier.nodes, simplifier.edgesets,
+                        nsamples, npositions)
+
+
+def table_tmrcas(nodes, edgesets, nsamples=10, npositions=20):
+    """
+    As tmrcas, for a NodeTable and an EdgesetTable.
+    """
+    import itertools
+    import numpy as np
+    import msprime
+    ts = msprime.load_tables(nodes=nodes, edgesets=edgesets)
+    positions = np.sort(np.random.RandomState(1).uniform(size=npositions))
+    trees = ts.trees()
+    tree = next(trees)
+    rv = []
+    for x in positions:
+        while tree.interval[1] <= x:
+            tree = next(trees)
+        for i, j in itertools.combinations(range(nsamples), 2):
+            m = tree.mrca(i, j)
+            rv.append(tree.time(m) if m != msprime.NULL_NODE else -1.0)
+    return rv
+
+
+def random_ancestry(N=10, generations=8, seed=1):
+    """
+    Nodes and edges, in the AncestryTracker's format, of
+    N haploids over a number of generations.  Each child
+    has two parents, with one crossover between them.
+    Returns the nodes, the edges, and the last generation's
+    node IDs.
+    """
+    import numpy as np
+    from fwdpy11_arg_example.wfarg import node_id_bits
+    if node_id_bits == 32:
+        id_type, unsigned_id_type = np.int32, np.uint32
+    else:
+        id_type, unsigned_id_type = np.int64, np.uint64
+    node_dtype = np.dtype([('id', unsigned_id_type),
+                           ('population', np.int32),
+                           ('generation', np.float64)], align=True)
+    edge_dtype = np.dtype([('left', np.float64), ('right', np.float64),
+                           ('parent', id_type), ('child', id_type)],
+                          align=True)
+    rng = np.random.RandomState(seed)
+    nodes = np.zeros(N * (generations + 1), dtype=node_dtype)
+    nodes['id'] = np.arange(len(nodes))
+    nodes['generation'] = np.repeat(np.arange(generations + 1), N)
+    edges = []
+    for g in range(1, generations + 1):
+        for child in range(g * N, (g + 1) * N):
+            p1, p2 = (g - 1) * N + rng.choice(N, 2, replace=False)
+            x = rng.uniform()
+            edges.append((0.0, x, p1, child))
+            edges.append((x, 1.0, p2, child))
+    edges = np.array(edges, dtype=edge_dtype)
+    return nodes, edges, np.arange(generations * N, len(nodes))
+
+
+class tests_Simplification(unittest.TestCase):
+    """
+    The simplified tables do not depend on how
+    the ancestry is recorded or simplified.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.simplifier, cls.atracker, _ = evolve()
+        cls.tmrcas = tmrcas(cls.simplifier)
+
+    def assertSameTables(self, simplifier, rows=True):
+        # Edgeset rows are not compared, because msprime groups
+        # children into edgesets, but native simplification
+        # outputs one child per row.
+        if rows is True:
+            self.assertEqual(simplifier.nodes.num_rows,
+                             self.simplifier.nodes.num_rows)
+        self.assertEqual(tmrcas(simplifier), self.tmrcas)
+
+    def test_native(self):
+        simplifier, atracker, _ = evolve(native_simplify=True)
+        self.assertSameTables(simplifier)
+
+    def test_presort(self):
+        self.assertSameTables(evolve(presort_edges=True)[0])
+
+    def test_prune(self):
+        self.assertSameTables(evolve(prune_extinct=True)[0])
+
+    def test_defer(self):
+        self.assertSameTables(evolve(defer_edges=True)[0])
+
+    def test_compact(self):
+        # Positions are rounded, so edges could differ,
+        # but not the trees at random positions.
+        self.assertSameTables(evolve(compact=True)[0], rows=False)
+
+    def test_background(self):
+        simplifier = evolve(background_simplify=True)[0]
+        self.assertSameTables(simplifier)
+        # Each worker's time is filled in once it is joined
+        for record in simplifier.gc_records:
+            self.assertGreaterEqual(record['time_simplifying'], 0.0)
+            self.assertGreaterEqual(record['time_waiting'], 0.0)
+
+    def test_parallel(self):
+        # More than one thread gives different random
+        # numbers, but not different ones for more threads.
+        two = evolve(nthreads=2)[0]
+        three = evolve(nthreads=3)[0]
+        self.assertEqual(two.nodes.num_rows, three.nodes.num_rows)
+        self.assertEqual(two.edgesets.num_rows, three.edgesets.num_rows)
+        self.assertEqual(tmrcas(two), tmrcas(three))
+
+    def test_sample_flags(self):
+        import numpy as np
+        for simplifier in (self.simplifier,
+                           evolve(native_simplify=True)[0]):
+            flags = np.array(simplifier.nodes.flags)
+            # The samples are the first 2N nodes
+            self.assertEqual(flags[:100].tolist(), [1] * 100)
+            self.assertEqual(np.count_nonzero(flags[100:]), 0)
+
+
+class tests_NeutralEngine(unittest.TestCase):
+    """
+    Without selected mutations, the neutral engine is used.
+    It draws different random numbers than the general
+    engine, so the two are compared by the mean TMRCA of
+    pairs of samples, which is about 2N generations.
+    """
+    def mean_tmrca(self, **kwargs):
+        import numpy as np
+        N = 20
+        rv = []
+        for seed in range(1, 6):
+            simplifier = evolve(seed=seed, N=N, **kwargs)[0]
+            t = np.array(tmrcas(simplifier))
+            # Pairs that have not coalesced are left out
+            rv.extend(t[t >= 0.0])
+        return np.mean(rv) / (2.0 * N)
+
+    def test_mean_tmrca(self):
+        neutral = self.mean_tmrca(mu=0.0)
+        general = self.mean_tmrca(s=0.0)
+        for t in (neutral, general):
+            self.assertGreater(t, 0.6)
+            self.assertLess(t, 1.4)
+        self.assertLess(abs(neutral - general), 0.3)
+
+
+class tests_Buffers(unittest.TestCase):
+    def test_buffer_reallocations(self):
+        import numpy as np
+        simplifier, atracker, _ = evolve(stats_generations=100)
+        stats = np.sort(atracker.stats, order='generation')
+        self.assertEqual(len(stats), 100)
+        # The buffers are reserved at each GC, so after
+        # the first few GCs they never have to grow.
+        counts = stats['buffer_reallocations']
+        self.assertEqual(counts[0], counts[-1])
+        self.assertEqual(counts[-1], atracker.buffer_reallocations)
+
+
+class tests_GenerationStats(unittest.TestCase):
+    def test_ring(self):
+        import numpy as np
+        N, generations = 50, 200
+        simplifier, atracker, _ = evolve(N=N, generations=generations,
+                                         stats_generations=5)
+        self.assertEqual(atracker.stats_recorded, generations)
+        stats = atracker.stats
+        # Only the last five generations are kept
+        self.assertEqual(len(stats), 5)
+        self.assertEqual(sorted(stats['generation']),
+                         list(range(generations - 4, generations + 1)))
+        self.assertTrue(np.all(stats['nodes'] == 2 * N))
+        # Each meiosis makes at least one edge
+        self.assertTrue(np.all(stats['edges'] >= stats['nodes']))
+        self.assertTrue(np.all(stats['finish_seconds'] >= 0.0))
+
+    def test_disabled(self):
+        simplifier, atracker, _ = evolve(generations=20)
+        self.assertEqual(atracker.stats_recorded, 0)
+        self.assertEqual(len(atracker.stats), 0)
+
+
+class tests_Autotune(unittest.TestCase):
+    def test_choose_interval(self):
+        import numpy as np
+        from fwdpy11_arg_example.evolve_arg import _choose_interval
+        candidates = [2, 5, 10, 20, 50, 100]
+        x = np.array(candidates, dtype=np.float64)
+        # The time per generation is least at sqrt(10 / 0.01)
+        seconds = 1.0 + 10.0 / x + 0.01 * x
+        peak_bytes = 1000.0 + 100.0 * x
+        self.assertEqual(_choose_interval(candidates, seconds, peak_bytes),
+                         32)
+        self.assertEqual(_choose_interval(candidates, seconds, peak_bytes,
+                                          max_bytes=3000), 20)
+        with self.assertRaises(ValueError):
+            _choose_interval(candidates, seconds, peak_bytes, max_bytes=100)
+        # With two candidates, there is no fit
+        self.assertEqual(_choose_interval([5, 10], [2.0, 1.0], [10, 20],
+                                          max_bytes=15), 5)
+
+    def test_key(self):
+        import fwdpy11.fitness
+        from fwdpy11_arg_example.evolve_arg import _object_key
+        self.assertEqual(_object_key(fwdpy11.fitness.SlocusMult(2.0)),
+                         _object_key(fwdpy11.fitness.SlocusMult(2.0)))
+        self.assertNotEqual(_object_key(fwdpy11.fitness.SlocusMult(2.0)),
+                            _object_key(fwdpy11.fitness.SlocusMult(1.0)))
+
+    def test_params_unchanged(self):
+        import numpy as np
+        import fwdpy11
+        import fwdpy11.fitness
+        import fwdpy11.model_params
+        from fwdpy11_arg_example.evolve_arg import autotune_gc_interval
+        demography = np.array([20] * 100, dtype=np.uint32)
+        params = fwdpy11.model_params.SlocusParams(
+            rates=(0.0, 1e-2, 0.5), nregions=[],
+            sregions=[fwdpy11.ConstantS(0, 1, 1, -0.025, 1.0)],
+            recregions=[fwdpy11.Region(0, 1, 1)],
+            gvalue=fwdpy11.fitness.SlocusMult(2.0), demography=demography)
+        interval = autotune_gc_interval(params, candidates=[5, 10],
+                                        pilot_generations=20)
+        self.assertIn(interval, [5, 10])
+        self.assertIs(params.demography, demography)
+
+
+class tests_NativeSimplify(unittest.TestCase):
+    """
+    AncestryTracker.simplify, applied to hand-built
+    nodes and edges, matches msprime.simplify_tables.
+    """
+    def simplify_native(self, nodes, edges, samples):
+        from fwdpy11_arg_example.wfarg import (AncestryTracker, NodeArray,
+                                               EdgeArray, VecInt32)
+        from fwdpy11_arg_example.argsimplifier import ArgSimplifier
+        a = AncestryTracker(1)
+        a.nodes = NodeArray(nodes)
+        a.edges = EdgeArray(edges)
+        a.next_index = len(nodes)
+        samples = VecInt32(samples.tolist())
+        a.samples = samples
+        idmap = list(a.simplify(samples))
+        simplifier = ArgSimplifier(10, native=True)
+        simplifier.export_tables(a)
+        return idmap, simplifier.nodes, simplifier.edgesets
+
+    def simplify_msprime(self, nodes, edges, samples):
+        import numpy as np
+        import msprime
+        time = nodes['generation'].max() - nodes['generation']
+        flags = np.zeros(len(nodes), dtype=np.uint32)
+        flags[samples] = 1
+        n = msprime.NodeTable()
+        n.set_columns(flags=flags, population=nodes['population'],
+                      time=time)
+        # msprime's order: parent time, parent, child, left
+        order = np.lexsort((edges['left'], edges['child'],
+                            edges['parent'], time[edges['parent']]))
+        edges = edges[order]
+        e = msprime.EdgesetTable()
+        e.set_columns(left=edges['left'], right=edges['right'],
+                      parent=edges['parent'].astype(np.int32),
+                      children=edges['child'].astype(np.int32),
+                      children_length=np.ones(len(edges), dtype=np.uint32))
+        msprime.simplify_tables(samples=samples.astype(np.int32),
+                                nodes=n, edgesets=e)
+        return n, e
+
+    def test_random_ancestry(self):
+        import numpy as np
+        for seed in (1, 2, 3):
+            nodes, edges, samples = random_ancestry(seed=seed)
+            idmap, native_nodes, native_edges = self.simplify_native(
+                nodes, edges, samples)
+            n, e = self.simplify_msprime(nodes, edges, samples)
+            self.assertEqual(len(idmap), len(nodes))
+            self.assertEqual([idmap[i] for i in samples],
+                             list(range(len(samples))))
+            self.assertEqual(native_nodes.num_rows, n.num_rows)
+            self.assertEqual(sorted(native_nodes.time), sorted(n.time))
+            self.assertEqual(table_tmrcas(native_nodes, native_edges),
+                             table_tmrcas(n, e))
+
 
 if __name__ == "__main__":
     unittest.main()